@@ -0,0 +1,94 @@
+"""
+Admin dashboard statistics.
+
+Everything is computed server-side: collection totals come from
+`estimated_document_count` (collection metadata, no scan), revenue from one
+`$group` over orders, and the category mix plus low-stock list from a single
+`$facet` aggregation over products. The dashboard polls the endpoint, so the
+result is shared by all admins and recomputed at most once per
+ADMIN_STATS_TTL_SECONDS.
+"""
+
+import copy
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from database import db
+
+ADMIN_STATS_TTL_SECONDS = float(os.getenv("ADMIN_STATS_TTL_SECONDS", "15"))
+
+LOW_STOCK_THRESHOLD = 10
+
+# Public product fields (checkout reservation tags stay internal)
+LOW_STOCK_FIELDS = ("name", "description", "category", "price", "stock_quantity", "image_url", "created_at")
+
+
+def compute_admin_stats(database) -> Dict:
+    start = time.time()
+
+    revenue = list(database.orders.aggregate([
+        {"$match": {"status": {"$ne": "cancelled"}}},
+        {"$group": {"_id": None, "total": {"$sum": "$total"}}},
+    ]))
+
+    facets = list(database.products.aggregate([
+        {"$facet": {
+            "popular_categories": [
+                {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+                {"$limit": 5},
+            ],
+            "low_stock_products": [
+                {"$match": {"stock_quantity": {"$lt": LOW_STOCK_THRESHOLD}}},
+                {"$limit": 10},
+                {"$project": {field: 1 for field in LOW_STOCK_FIELDS}},
+            ],
+        }},
+    ]))[0]
+
+    low_stock_products = facets["low_stock_products"]
+    for product in low_stock_products:
+        product["_id"] = str(product["_id"])
+
+    stats = {
+        "total_users": database.users.estimated_document_count(),
+        "total_products": database.products.estimated_document_count(),
+        "total_orders": database.orders.estimated_document_count(),
+        "total_revenue": round(revenue[0]["total"] if revenue else 0, 2),
+        "popular_categories": facets["popular_categories"],
+        "low_stock_products": low_stock_products,
+        "generated_at": datetime.utcnow(),
+    }
+
+    print(f"[OPTIMIZATION] Admin stats computed in {(time.time() - start) * 1000:.1f}ms")
+    return stats
+
+
+class AdminStatsCache:
+    """Single cached stats document with a TTL; one recompute at a time"""
+
+    def __init__(self, database, ttl_seconds: float):
+        self._db = database
+        self.ttl_seconds = ttl_seconds
+        self._stats: Optional[Dict] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Dict:
+        if self._stats is None or time.time() >= self._expires_at:
+            with self._lock:
+                # Concurrent pollers wait for the one recompute instead of repeating it
+                if self._stats is None or time.time() >= self._expires_at:
+                    self._stats = compute_admin_stats(self._db)
+                    self._expires_at = time.time() + self.ttl_seconds
+        return copy.deepcopy(self._stats)
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+
+# Process-wide instance used by the admin endpoints
+admin_stats_cache = AdminStatsCache(db, ADMIN_STATS_TTL_SECONDS)
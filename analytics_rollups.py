@@ -0,0 +1,308 @@
+"""
+Time-bucketed rollups for the admin analytics views.
+
+Two collections hold pre-aggregated hourly and daily buckets:
+- `sales_rollups`: orders, items and revenue per bucket, plus revenue and
+  items per product category
+- `interaction_rollups`: views, likes, ratings (and the rating sum) per
+  bucket, per product and for all products together (`product_id: "all"`)
+
+Checkout and interaction ingestion `$inc` the affected buckets as events are
+stored (one bulk_write per order or per interaction batch), so the
+time-series endpoints read one document per bucket instead of scanning the
+raw `orders` and `interactions`.
+
+History from before the rollups existed is loaded with the backfill command.
+It rebuilds complete buckets only: the hour and day in progress are left to
+the live counters, so a backfill never races with them.
+
+Usage:
+    python analytics_rollups.py --backfill
+    python analytics_rollups.py --backfill --since 2025-01-01
+"""
+
+import argparse
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReplaceOne, UpdateOne
+
+from database import db
+
+SALES_COLLECTION = "sales_rollups"
+INTERACTION_COLLECTION = "interaction_rollups"
+
+GRANULARITIES = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+ALL_PRODUCTS = "all"
+MAX_BUCKETS = 2000
+
+# interaction_type -> counter field
+INTERACTION_FIELDS = {"view": "views", "like": "likes", "rating": "ratings"}
+UNKNOWN_CATEGORY = "Unknown"
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _bucket_key(granularity: str, bucket: datetime) -> str:
+    return f"{granularity}:{bucket:%Y-%m-%dT%H}"
+
+
+def _field_name(value: str) -> str:
+    """Category names become field names: no dots or leading `$`"""
+    return value.replace(".", "_").lstrip("$") or UNKNOWN_CATEGORY
+
+
+# ==================== INCREMENTS ====================
+
+def sales_increments(orders: Iterable[Dict], categories: Dict[str, str]) -> Dict[Tuple, Dict[str, float]]:
+    """(granularity, bucket) -> counters to add, for a set of orders"""
+    increments: Dict[Tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for order in orders:
+        if order.get("status") == "cancelled":
+            continue
+        for granularity in GRANULARITIES:
+            counters = increments[(granularity, bucket_start(order["created_at"], granularity))]
+            counters["orders"] += 1
+            counters["revenue"] += order.get("total", 0)
+            for item in order.get("items", []):
+                category = _field_name(categories.get(item["product_id"]) or UNKNOWN_CATEGORY)
+                counters["items"] += item.get("quantity", 0)
+                counters[f"categories.{category}.revenue"] += item.get("subtotal", 0)
+                counters[f"categories.{category}.items"] += item.get("quantity", 0)
+    return increments
+
+
+def interaction_increments(interactions: Iterable[Dict]) -> Dict[Tuple, Dict[str, float]]:
+    """(granularity, bucket, product_id) -> counters to add, for a set of interactions"""
+    increments: Dict[Tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for interaction in interactions:
+        field = INTERACTION_FIELDS.get(interaction.get("interaction_type"), "other")
+        rating = interaction.get("rating")
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(interaction["timestamp"], granularity)
+            for product_id in (interaction["product_id"], ALL_PRODUCTS):
+                counters = increments[(granularity, bucket, product_id)]
+                counters[field] += 1
+                if rating is not None:
+                    counters["rating_sum"] += rating
+    return increments
+
+
+def _sales_document(granularity: str, bucket: datetime) -> Dict:
+    return {"_id": _bucket_key(granularity, bucket), "granularity": granularity, "bucket": bucket}
+
+
+def _interaction_document(granularity: str, bucket: datetime, product_id: str) -> Dict:
+    return {
+        "_id": f"{_bucket_key(granularity, bucket)}:{product_id}",
+        "granularity": granularity,
+        "bucket": bucket,
+        "product_id": product_id,
+    }
+
+
+def _increment_ops(increments: Dict[Tuple, Dict[str, float]], make_document) -> List[UpdateOne]:
+    operations = []
+    for key, counters in increments.items():
+        document = make_document(*key)
+        operations.append(UpdateOne(
+            {"_id": document.pop("_id")},
+            {"$inc": dict(counters), "$setOnInsert": document},
+            upsert=True,
+        ))
+    return operations
+
+
+# ==================== LIVE UPDATES ====================
+
+def record_order(order: Dict, categories: Dict[str, str]):
+    """Add a placed order to its hourly and daily buckets (product_id -> category)"""
+    operations = _increment_ops(sales_increments([order], categories), _sales_document)
+    if operations:
+        db[SALES_COLLECTION].bulk_write(operations, ordered=False)
+
+
+def record_interactions(interactions: List[Dict]):
+    """Add a batch of stored interactions to their buckets in one bulk_write"""
+    operations = _increment_ops(interaction_increments(interactions), _interaction_document)
+    if operations:
+        db[INTERACTION_COLLECTION].bulk_write(operations, ordered=False)
+
+
+# ==================== TIME SERIES ====================
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Stored timestamps are naive UTC; convert aware query parameters to match"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def bucket_range(granularity: str, start: Optional[datetime], end: Optional[datetime]) -> List[datetime]:
+    """Bucket starts covering [start, end); ValueError if the range is invalid or too long"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    step = GRANULARITIES[granularity]
+
+    end = _naive_utc(end) or datetime.utcnow()
+    start = _naive_utc(start) or end - step * (48 if granularity == "hour" else 30)
+    if start >= end:
+        raise ValueError("start must be before end")
+    if (end - start) / step > MAX_BUCKETS:
+        raise ValueError(f"At most {MAX_BUCKETS} buckets per request")
+
+    buckets = []
+    bucket = bucket_start(start, granularity)
+    while bucket < end:
+        buckets.append(bucket)
+        bucket += step
+    return buckets
+
+
+def sales_series(granularity: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
+    """One entry per bucket (zeros where nothing was sold), oldest first"""
+    buckets = bucket_range(granularity, start, end)
+    stored = {
+        doc["bucket"]: doc
+        for doc in db[SALES_COLLECTION].find(
+            {"granularity": granularity, "bucket": {"$gte": buckets[0], "$lte": buckets[-1]}},
+            {"_id": 0, "granularity": 0},
+        )
+    }
+
+    series = []
+    for bucket in buckets:
+        doc = stored.get(bucket, {})
+        series.append({
+            "bucket": bucket,
+            "orders": int(doc.get("orders", 0)),
+            "items": int(doc.get("items", 0)),
+            "revenue": round(doc.get("revenue", 0), 2),
+            "categories": {
+                category: {"revenue": round(values.get("revenue", 0), 2), "items": int(values.get("items", 0))}
+                for category, values in doc.get("categories", {}).items()
+            },
+        })
+    return series
+
+
+def interaction_series(
+    granularity: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    product_id: str = ALL_PRODUCTS,
+) -> List[Dict]:
+    """One entry per bucket for one product (or all products), oldest first"""
+    buckets = bucket_range(granularity, start, end)
+    stored = {
+        doc["bucket"]: doc
+        for doc in db[INTERACTION_COLLECTION].find(
+            {
+                "granularity": granularity,
+                "product_id": product_id,
+                "bucket": {"$gte": buckets[0], "$lte": buckets[-1]},
+            },
+            {"_id": 0, "granularity": 0, "product_id": 0},
+        )
+    }
+
+    series = []
+    for bucket in buckets:
+        doc = stored.get(bucket, {})
+        ratings = int(doc.get("ratings", 0))
+        series.append({
+            "bucket": bucket,
+            "views": int(doc.get("views", 0)),
+            "likes": int(doc.get("likes", 0)),
+            "ratings": ratings,
+            "average_rating": round(doc.get("rating_sum", 0) / ratings, 2) if ratings else None,
+        })
+    return series
+
+
+# ==================== BACKFILL ====================
+
+def _rebuild(collection, increments: Dict[Tuple, Dict[str, float]], make_document, since, cutoffs, run_id: int) -> int:
+    """Replace complete buckets with recomputed ones, then drop stale complete buckets"""
+    operations = []
+    for key, counters in increments.items():
+        granularity, bucket = key[0], key[1]
+        if bucket >= cutoffs[granularity]:
+            continue  # in progress: owned by the live counters
+        document = make_document(*key)
+        document["backfill"] = run_id
+        for path, value in counters.items():
+            # "categories.Books.revenue" -> nested fields
+            target = document
+            *parents, leaf = path.split(".")
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[leaf] = value
+        operations.append(ReplaceOne({"_id": document["_id"]}, document, upsert=True))
+
+    for i in range(0, len(operations), 1000):
+        collection.bulk_write(operations[i:i + 1000], ordered=False)
+
+    for granularity, cutoff in cutoffs.items():
+        query = {"granularity": granularity, "bucket": {"$lt": cutoff}, "backfill": {"$ne": run_id}}
+        if since is not None:
+            query["bucket"]["$gte"] = since
+        collection.delete_many(query)
+
+    return len(operations)
+
+
+def backfill(since: Optional[datetime] = None) -> Dict[str, int]:
+    """Recompute complete hourly/daily buckets from raw orders and interactions"""
+    start = time.time()
+    run_id = int(start * 1000)
+    now = datetime.utcnow()
+    cutoffs = {granularity: bucket_start(now, granularity) for granularity in GRANULARITIES}
+
+    # Whole days, so the first daily bucket is complete as well
+    if since is not None:
+        since = bucket_start(since, "day")
+    window = {"$lt": now} if since is None else {"$gte": since, "$lt": now}
+
+    categories = {str(p["_id"]): p.get("category") for p in db.products.find({}, {"category": 1})}
+    orders = db.orders.find({"created_at": window}, {"created_at": 1, "total": 1, "items": 1, "status": 1})
+    sales = _rebuild(
+        db[SALES_COLLECTION], sales_increments(orders, categories), _sales_document, since, cutoffs, run_id
+    )
+
+    interactions = db.interactions.find(
+        {"timestamp": window}, {"_id": 0, "product_id": 1, "interaction_type": 1, "rating": 1, "timestamp": 1}
+    )
+    activity = _rebuild(
+        db[INTERACTION_COLLECTION], interaction_increments(interactions), _interaction_document, since, cutoffs, run_id
+    )
+
+    print(
+        f"[ROLLUPS] Backfilled {sales} sales and {activity} interaction buckets "
+        f"in {time.time() - start:.1f}s"
+    )
+    return {"sales_buckets": sales, "interaction_buckets": activity}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain hourly/daily analytics rollups")
+    parser.add_argument("--backfill", action="store_true", help="Rebuild complete buckets from raw data")
+    parser.add_argument(
+        "--since", type=datetime.fromisoformat, default=None,
+        help="Only rebuild buckets from this date on (UTC, ISO format)",
+    )
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.error("nothing to do (use --backfill)")
+    backfill(args.since)
+
+
+if __name__ == "__main__":
+    main()
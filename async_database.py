@@ -0,0 +1,33 @@
+"""
+Async MongoDB access (Motor) for async endpoints.
+
+Uses the same URI, database and pool settings as the shared PyMongo client in
+`database.py`. A Motor client is bound to the event loop it was first used on,
+so it is created lazily inside the running loop instead of at import time.
+"""
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from database import CLIENT_OPTIONS, DB_NAME, MONGO_URI
+
+_async_client = None
+
+
+def get_async_client() -> AsyncIOMotorClient:
+    """Shared Motor client (created on first use)"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncIOMotorClient(MONGO_URI, **CLIENT_OPTIONS)
+        print("[OPTIMIZATION] Async MongoDB client (Motor) initialized with shared pool settings")
+    return _async_client
+
+
+def get_async_db():
+    """Async handle to the application database"""
+    return get_async_client()[DB_NAME]
+
+
+def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        _async_client.close()
+        _async_client = None
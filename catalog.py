@@ -0,0 +1,347 @@
+"""
+In-process catalog snapshot.
+
+The product catalog is small and read on nearly every request, so the whole
+collection is held in memory:
+- id -> product dict
+- category -> product ids
+- column arrays (product ids, category codes, prices) in `_id` order for
+  vectorized candidate scoring
+
+The snapshot is loaded once and kept fresh by a background thread that
+follows a MongoDB change stream. Change streams need a replica set; on a
+standalone mongod the thread falls back to reloading every `poll_seconds`.
+Writers in this process also call `refresh_product` so their own changes are
+visible immediately. Listeners registered with `subscribe` are called with
+the ID of every product that changed on the change stream or between two
+polling reloads, so dependent caches in other workers are invalidated too.
+
+A change to one existing product is patched copy-on-write: the products dict
+is copied with the new entry and, when price or category changed, the
+affected column array and category lists are copied and rewritten (stock-only
+updates, the bulk of checkout traffic, copy the dict only). Inserts, deletes
+and new categories rebuild the indexes. Either way a new state is swapped in
+as a whole: a snapshot a reader holds is never mutated, and `get`/`get_many`
+return copies.
+
+The transient `reservations` field written by two-phase checkouts is not
+kept in the snapshot.
+"""
+
+import bisect
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+from bson import ObjectId
+
+from database import products_collection
+
+
+class CatalogArrays(NamedTuple):
+    """Column view of the catalog, rows in `_id` order"""
+
+    product_ids: np.ndarray  # object array of string IDs
+    category_codes: np.ndarray  # int index into `categories`
+    prices: np.ndarray  # float64
+    categories: List[str]
+    category_index: Dict[str, int]
+
+
+class _State(NamedTuple):
+    products: Dict[str, Dict]
+    by_category: Dict[str, List[str]]
+    arrays: CatalogArrays
+    rows: Dict[str, int]  # product id -> row in `arrays`
+
+
+# Fields whose changes never affect the category index or the columns
+_STOCK_FIELDS = {"stock_quantity", "reservations"}
+
+
+def _clean(product: Dict) -> Dict:
+    product["_id"] = str(product["_id"])
+    product.pop("reservations", None)
+    return product
+
+
+def _build_state(products: Dict[str, Dict]) -> _State:
+    product_ids = sorted(products)  # hex ObjectIds sort like _id
+
+    by_category: Dict[str, List[str]] = defaultdict(list)
+    for product_id in product_ids:
+        by_category[products[product_id].get("category")].append(product_id)
+
+    categories = sorted(c for c in by_category if c is not None)
+    category_index = {category: code for code, category in enumerate(categories)}
+
+    arrays = CatalogArrays(
+        product_ids=np.array(product_ids, dtype=object),
+        category_codes=np.array(
+            [category_index.get(products[pid].get("category"), -1) for pid in product_ids],
+            dtype=np.int64,
+        ),
+        prices=np.array(
+            [float(products[pid].get("price", 0) or 0) for pid in product_ids],
+            dtype=np.float64,
+        ),
+        categories=categories,
+        category_index=category_index,
+    )
+    rows = {product_id: row for row, product_id in enumerate(product_ids)}
+    return _State(products, dict(by_category), arrays, rows)
+
+
+class CatalogSnapshot:
+    """Read-mostly in-memory copy of the products collection"""
+
+    def __init__(self, collection, poll_seconds: float = 30.0):
+        self._collection = collection
+        self.poll_seconds = poll_seconds
+
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        # Swapped as a whole so readers always see a consistent snapshot
+        self._state = _build_state({})
+        self._loaded_at: Optional[float] = None
+
+        self._listeners: List[Callable[[str], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.mode = "not_started"
+
+    # ==================== LOADING ====================
+
+    def load(self):
+        """Replace the snapshot with a full read of the collection"""
+        start = time.time()
+
+        products = {}
+        for product in self._collection.find().sort("_id", 1):
+            product = _clean(product)
+            products[product["_id"]] = product
+
+        state = _build_state(products)
+        with self._lock:
+            previous = self._state.products if self._loaded_at is not None else None
+            self._state = state
+            self._loaded_at = time.time()
+
+        print(
+            f"[OPTIMIZATION] Catalog snapshot loaded: {len(products)} products "
+            f"in {(time.time() - start) * 1000:.1f}ms"
+        )
+
+        if previous is not None and self._listeners:
+            # A reload (polling, or a change stream restart) may carry changes nobody was told about
+            changed = [
+                product_id for product_id in set(previous) | set(products)
+                if previous.get(product_id) != products.get(product_id)
+            ]
+            self._notify(changed)
+
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def ensure_loaded(self):
+        if self._loaded_at is None:
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self.load()
+
+    def refresh_product(self, product_id: str):
+        """Re-read one product after a local write (or drop it if deleted)"""
+        if self._loaded_at is None:
+            return
+        try:
+            product = self._collection.find_one({"_id": ObjectId(product_id)})
+        except Exception:
+            return
+        self._apply(product_id, product)
+
+    def _apply(self, product_id: str, product: Optional[Dict]):
+        if product is not None:
+            product = _clean(product)
+
+        with self._lock:
+            state = self._state
+            current = state.products.get(product_id)
+
+            if product is None or current is None:
+                # Insert or delete: row numbers shift, rebuild everything
+                products = dict(state.products)
+                if product is None:
+                    products.pop(product_id, None)
+                else:
+                    products[product_id] = product
+                self._state = _build_state(products)
+                return
+
+            products = dict(state.products)
+            products[product_id] = product
+
+            changed = {
+                field for field in set(current) | set(product)
+                if current.get(field) != product.get(field)
+            }
+            if changed <= _STOCK_FIELDS:
+                self._state = state._replace(products=products)
+                return
+
+            old_category, new_category = current.get("category"), product.get("category")
+            if new_category != old_category and (
+                new_category not in state.arrays.category_index
+                or len(state.by_category.get(old_category, ())) <= 1
+            ):
+                # The category list itself changes (new category, or the old one empties)
+                self._state = _build_state(products)
+                return
+
+            # Copy what changes; readers may be using the current arrays and lists
+            row = state.rows[product_id]
+            arrays, by_category = state.arrays, state.by_category
+            if new_category != old_category:
+                by_category = dict(by_category)
+                by_category[old_category] = [
+                    pid for pid in by_category.get(old_category, ()) if pid != product_id
+                ]
+                members = list(by_category.get(new_category, ()))
+                bisect.insort(members, product_id)
+                by_category[new_category] = members
+                category_codes = arrays.category_codes.copy()
+                category_codes[row] = arrays.category_index[new_category]
+                arrays = arrays._replace(category_codes=category_codes)
+            price = float(product.get("price", 0) or 0)
+            if price != arrays.prices[row]:
+                prices = arrays.prices.copy()
+                prices[row] = price
+                arrays = arrays._replace(prices=prices)
+            self._state = _State(products, by_category, arrays, state.rows)
+
+    # ==================== CHANGE FOLLOWING ====================
+
+    def subscribe(self, listener: Callable[[str], None]):
+        """Call `listener(product_id)` for every change seen on the change stream or by a reload"""
+        self._listeners.append(listener)
+
+    def _notify(self, product_ids: Iterable[str]):
+        for product_id in product_ids:
+            for listener in self._listeners:
+                try:
+                    listener(product_id)
+                except Exception as e:
+                    print(f"ERROR in catalog listener for {product_id}: {e}")
+
+    def start(self):
+        """Load (if needed) and start following changes in a daemon thread"""
+        self.ensure_loaded()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._follow, name="catalog-watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _follow(self):
+        while not self._stop.is_set():
+            try:
+                stream = self._collection.watch(full_document="updateLookup", max_await_time_ms=1000)
+            except Exception as e:
+                print(
+                    f"[OPTIMIZATION] Catalog change streams unavailable ({e}); "
+                    f"polling every {self.poll_seconds:.0f}s"
+                )
+                self._poll()
+                return
+
+            self.mode = "change_stream"
+            try:
+                with stream:
+                    # Reload once the stream is open so nothing between the
+                    # initial load and the stream start is missed
+                    self.load()
+                    while stream.alive and not self._stop.is_set():
+                        change = stream.try_next()
+                        if change is not None:
+                            self._on_change(change)
+            except Exception as e:
+                print(f"[OPTIMIZATION] Catalog change stream interrupted: {e}")
+                self._stop.wait(self.poll_seconds)
+
+    def _poll(self):
+        self.mode = "polling"
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.load()
+            except Exception as e:
+                print(f"ERROR reloading catalog snapshot: {e}")
+
+    def _on_change(self, change: Dict):
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace", "delete"):
+            product_id = str(change["documentKey"]["_id"])
+            self._apply(product_id, change.get("fullDocument"))
+            self._notify([product_id])
+        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self.load()
+
+    # ==================== QUERIES ====================
+
+    def lookup(self, product_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Snapshot documents by ID, shared (callers must copy before mutating)"""
+        self.ensure_loaded()
+        products = self._state.products
+        return {pid: products[pid] for pid in product_ids if pid in products}
+
+    def products(self) -> Dict[str, Dict]:
+        """Every snapshot document by ID, shared (callers must copy before mutating)"""
+        self.ensure_loaded()
+        return self._state.products
+
+    def get(self, product_id: str) -> Optional[Dict]:
+        self.ensure_loaded()
+        product = self._state.products.get(product_id)
+        return dict(product) if product is not None else None
+
+    def get_many(self, product_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Copies of the requested products, in request order"""
+        return {pid: dict(product) for pid, product in self.lookup(product_ids).items()}
+
+    def categories(self) -> List[str]:
+        self.ensure_loaded()
+        return list(self._state.arrays.categories)
+
+    def by_category(self, categories: Iterable[str]) -> List[Dict]:
+        """Copies of all products in the given categories, in `_id` order"""
+        self.ensure_loaded()
+        products, by_category = self._state.products, self._state.by_category
+        product_ids = sorted(pid for category in set(categories) for pid in by_category.get(category, ()))
+        return [dict(products[pid]) for pid in product_ids]
+
+    def arrays(self) -> CatalogArrays:
+        self.ensure_loaded()
+        return self._state.arrays
+
+    def first(self, n: int, exclude: Iterable[str] = ()) -> List[Dict]:
+        """Copies of the first n products in `_id` order, skipping `exclude`"""
+        self.ensure_loaded()
+        excluded = set(exclude)
+        state = self._state
+        result = []
+        for product_id in state.arrays.product_ids:
+            if len(result) >= n:
+                break
+            if product_id not in excluded:
+                result.append(dict(state.products[product_id]))
+        return result
+
+
+# Process-wide instance shared by all modules
+catalog = CatalogSnapshot(products_collection)
@@ -1,34 +1,132 @@
 """
 Shared MongoDB connection for the entire application.
 This ensures we use a single connection pool across all modules.
+
+Importing this module does not connect. The client is created on first use
+(or by `connect()` from the application lifespan) and closed by `close()`.
+A process that was forked after the client existed gets its own client on
+first use, since PyMongo clients are not fork-safe.
+
+`client`, `db` and the `*_collection` names are lazy proxies that resolve
+through `get_client()` / `get_db()` on every use, so modules can keep binding
+them at import time.
 """
+import os
+import threading
+
 from pymongo import MongoClient
-import sys
+from pymongo.database import Database
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://127.0.0.1:27017/")  # Local MongoDB
+DB_NAME = os.getenv("MONGO_DB_NAME", "ecommerce_db")
+
+# Pool settings shared by the sync (PyMongo) and async (Motor) clients
+CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),  # Maximum number of connections in the pool
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "10")),  # Minimum number of connections to keep open
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "45000")),  # Close idle connections
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000")),
+}
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+# ==================== LIFECYCLE ====================
+
+def get_client() -> MongoClient:
+    """Shared PyMongo client for this process (created on first use)"""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                # A client inherited through fork is dropped, not closed:
+                # its sockets belong to the parent
+                _client = MongoClient(MONGO_URI, **CLIENT_OPTIONS)
+                _client_pid = os.getpid()
+                print(
+                    f"[OPTIMIZATION] MongoDB client created for {DB_NAME} "
+                    f"(maxPoolSize={CLIENT_OPTIONS['maxPoolSize']}, "
+                    f"minPoolSize={CLIENT_OPTIONS['minPoolSize']})"
+                )
+    return _client
+
+
+def get_db() -> Database:
+    return get_client()[DB_NAME]
+
+
+def connect(ping: bool = True) -> MongoClient:
+    """Create the client and optionally wait for the server (used at startup)"""
+    connected = get_client()
+    if ping:
+        connected.admin.command("ping")
+        print(f"[OPTIMIZATION] Connected to MongoDB at {MONGO_URI}")
+    return connected
+
+
+def close():
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
 
-# Set UTF-8 encoding for Windows console
-if sys.platform == 'win32':
-    try:
-        sys.stdout.reconfigure(encoding='utf-8')
-    except:
-        pass
 
-print("[OPTIMIZATION] Initializing shared MongoDB connection with connection pooling...")
+# ==================== LAZY HANDLES ====================
 
-MONGO_URI = "mongodb://127.0.0.1:27017/"  # Local MongoDB
-print(f"[DEBUG] MONGO_URI = {MONGO_URI}")
+class _LazyClient:
+    """Stand-in for `get_client()`"""
 
-# Create single MongoDB client with connection pooling
-client = MongoClient(
-    MONGO_URI,
-    maxPoolSize=50,  # Maximum number of connections in the pool
-    minPoolSize=10,  # Minimum number of connections to keep open
-    maxIdleTimeMS=45000,  # Close connections after 45s of inactivity
-    serverSelectionTimeoutMS=5000,  # Timeout for selecting a server
-    connectTimeoutMS=10000,  # Timeout for initial connection
-)
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(get_client(), name)
 
-# Database instance
-db = client.ecommerce_db
+    def __getitem__(self, name):
+        return get_client()[name]
+
+
+class _LazyCollection:
+    """Stand-in for `get_db()[name]`"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return getattr(get_db()[self.name], attr)
+
+    def __getitem__(self, name):
+        return _LazyCollection(f"{self.name}.{name}")
+
+    def __repr__(self):
+        return f"<lazy collection {DB_NAME}.{self.name}>"
+
+
+class _LazyDatabase:
+    """Stand-in for `get_db()`; attribute and item access give lazy collections"""
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        # Same rule as pymongo.database.Database: methods win over collection names
+        if name.startswith("_") or hasattr(Database, name):
+            return getattr(get_db(), name)
+        return _LazyCollection(name)
+
+    def __getitem__(self, name):
+        return _LazyCollection(name)
+
+
+client = _LazyClient()
+db = _LazyDatabase()
 
 # Collections
 users_collection = db.users
@@ -37,7 +135,3 @@ interactions_collection = db.interactions
 carts_collection = db.carts
 orders_collection = db.orders
 password_reset_tokens = db.password_reset_tokens
-
-print("[OPTIMIZATION] MongoDB client configured with connection pooling (maxPoolSize=50)")
-print(f"[DEBUG] Connected to: {client.address}")
-print("[OPTIMIZATION] All collections initialized")
@@ -0,0 +1,337 @@
+"""
+Declarative MongoDB index management.
+
+`INDEXES` lists every index the application's queries rely on. `plan()` diffs
+it against `list_indexes()` and `apply()` carries out the difference: missing
+indexes are created, indexes whose definition changed are rebuilt and the
+ones named in `OBSOLETE` are dropped. Indexes that are neither declared nor
+obsolete are left alone. Applying an empty plan is a no-op, so this is safe to
+run on every deploy.
+
+Usage (one-off migration, e.g. a deploy step):
+    python indexes.py            # apply the plan
+    python indexes.py --check    # print the plan, exit 1 if it is not empty
+
+In the application, `IndexMigrator` runs in a background thread: the worker
+that wins the `index_migration` lease in `migration_locks` applies the plan,
+the others only re-check it until it is empty. `GET /api/health/ready`
+reports 503 until then. With INDEX_MIGRATION=off the workers never apply the
+plan themselves and wait for the migration command instead.
+"""
+
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from database import get_db
+
+INDEX_MIGRATION_ENABLED = os.getenv("INDEX_MIGRATION", "on") != "off"
+
+LOCK_COLLECTION = "migration_locks"
+LOCK_NAME = "index_migration"
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)]),
+    ],
+    "products": [
+        # Category listings page by _id
+        IndexModel([("category", ASCENDING), ("_id", ASCENDING)]),
+        # Same weights as search_index.FIELD_WEIGHTS
+        IndexModel(
+            [("name", TEXT), ("description", TEXT)],
+            weights={"name": 10, "description": 2},
+            name="product_text",
+        ),
+    ],
+    "interactions": [
+        # History keyset pages (_id tie-break) and recommendation profiles, newest first
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("interaction_type", ASCENDING)]),
+        # History counts per interaction type
+        IndexModel([("user_id", ASCENDING), ("interaction_type", ASCENDING)]),
+        # "Has this user interacted with this product" checks
+        IndexModel([("user_id", ASCENDING), ("product_id", ASCENDING)]),
+        # Per-product activity over time (popularity)
+        IndexModel([("product_id", ASCENDING), ("timestamp", DESCENDING)]),
+    ],
+    "carts": [
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "orders": [
+        # Admin list keyset pages and exports (created_at ranges, _id tie-break)
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)]),
+        # A user's orders, newest first
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "password_reset_tokens": [
+        IndexModel([("token", ASCENDING)], unique=True),
+    ],
+    # Time-series reads (analytics_rollups.py)
+    "sales_rollups": [
+        IndexModel([("granularity", ASCENDING), ("bucket", ASCENDING)]),
+    ],
+    "interaction_rollups": [
+        IndexModel([("granularity", ASCENDING), ("product_id", ASCENDING), ("bucket", ASCENDING)]),
+    ],
+    "pending_orders": [
+        # recover_pending_orders scans markers older than a cutoff
+        IndexModel([("created_at", ASCENDING)]),
+    ],
+}
+
+# Indexes replaced by an entry above (a collection can have only one text index)
+# or made redundant by a compound index they are a prefix of
+OBSOLETE: Dict[str, List[str]] = {
+    # name_text: old single-field text index; category_1: prefix of category_1__id_1
+    "products": ["name_text", "category_1"],
+    # Prefixes of user_id_1_timestamp_-1__id_-1 and product_id_1_timestamp_-1
+    "interactions": ["user_id_1", "product_id_1", "user_id_1_timestamp_-1"],
+    # Prefixes of created_at_-1__id_-1 and user_id_1_created_at_-1
+    "orders": ["created_at_-1", "user_id_1"],
+}
+
+# Options that change what an index does; anything else is ignored when diffing
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+class IndexChange(NamedTuple):
+    action: str  # "create", "rebuild" or "drop"
+    collection: str
+    name: str
+    model: Optional[IndexModel] = None
+
+    def describe(self) -> str:
+        return f"{self.action} {self.collection}.{self.name}"
+
+
+# ==================== DIFF ====================
+
+def _is_text(key) -> bool:
+    return any(direction == TEXT for _, direction in key.items())
+
+
+def _normalize_key(key) -> List:
+    return [
+        (field, int(direction) if isinstance(direction, (int, float)) else direction)
+        for field, direction in key.items()
+    ]
+
+
+def _same_definition(wanted: Dict, current: Dict) -> bool:
+    if _is_text(wanted["key"]) and "_fts" in current["key"]:
+        # MongoDB stores text keys as _fts/_ftsx: compare the indexed fields via the weights
+        wanted_weights = wanted.get("weights") or {field: 1 for field in wanted["key"]}
+        current_weights = {field: int(weight) for field, weight in current.get("weights", {}).items()}
+        if wanted_weights != current_weights:
+            return False
+    elif _normalize_key(wanted["key"]) != _normalize_key(current["key"]):
+        return False
+
+    for option in _COMPARED_OPTIONS:
+        if option == "unique":
+            if bool(wanted.get(option)) != bool(current.get(option)):
+                return False
+        elif wanted.get(option) != current.get(option):
+            return False
+    return True
+
+
+def plan(database=None) -> List[IndexChange]:
+    """
+    Changes needed to bring the database in line with `INDEXES`. Obsolete text
+    indexes are dropped first (their replacement cannot be built next to them);
+    other obsolete indexes only after the builds, so queries keep an index.
+    """
+    database = database if database is not None else get_db()
+
+    text_drops, builds, drops = [], [], []
+    for collection_name in sorted(set(INDEXES) | set(OBSOLETE)):
+        existing = {index["name"]: index for index in database[collection_name].list_indexes()}
+
+        for name in OBSOLETE.get(collection_name, ()):
+            if name in existing:
+                target = text_drops if _is_text(existing[name]["key"]) else drops
+                target.append(IndexChange("drop", collection_name, name))
+
+        for model in INDEXES.get(collection_name, ()):
+            wanted = model.document
+            current = existing.get(wanted["name"])
+            if current is None:
+                builds.append(IndexChange("create", collection_name, wanted["name"], model))
+            elif not _same_definition(wanted, current):
+                builds.append(IndexChange("rebuild", collection_name, wanted["name"], model))
+
+    return text_drops + builds + drops
+
+
+def apply(changes: List[IndexChange], database=None, on_progress=None) -> List[str]:
+    """Carry out a plan; returns the errors (each change is attempted independently)"""
+    database = database if database is not None else get_db()
+
+    errors = []
+    for change in changes:
+        collection = database[change.collection]
+        start = time.time()
+        try:
+            if change.action in ("drop", "rebuild"):
+                collection.drop_index(change.name)
+            if change.action in ("create", "rebuild"):
+                collection.create_indexes([change.model])
+        except PyMongoError as e:
+            errors.append(f"{change.describe()}: {e}")
+            print(f"ERROR: index migration step '{change.describe()}' failed: {e}")
+            continue
+        print(f"[OPTIMIZATION] Index {change.describe()} done in {(time.time() - start) * 1000:.0f}ms")
+        if on_progress is not None:
+            on_progress()
+    return errors
+
+
+# ==================== LEADER LEASE ====================
+
+def acquire_lease(owner: str, lease_seconds: float, database=None) -> bool:
+    """Take (or extend) the migration lease unless another live owner holds it"""
+    database = database if database is not None else get_db()
+    now = datetime.utcnow()
+    try:
+        database[LOCK_COLLECTION].find_one_and_update(
+            {"_id": LOCK_NAME, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=lease_seconds)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        # The lease document exists and belongs to someone else
+        return False
+
+
+def release_lease(owner: str, database=None):
+    database = database if database is not None else get_db()
+    database[LOCK_COLLECTION].delete_one({"_id": LOCK_NAME, "owner": owner})
+
+
+# ==================== BACKGROUND MIGRATOR ====================
+
+class IndexMigrator:
+    """Brings indexes in line in the background and tracks readiness"""
+
+    def __init__(self, apply_changes: bool = True, poll_seconds: float = 5.0, lease_seconds: float = 600.0):
+        self.apply_changes = apply_changes
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self.ready = False
+        self.leader = False
+        self.pending: List[str] = []
+        self.errors: List[str] = []
+        self.checked_at: Optional[datetime] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-migrator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._step():
+                    return
+            except PyMongoError as e:
+                self.errors = [str(e)]
+                print(f"ERROR checking indexes: {e}")
+            self._stop.wait(self.poll_seconds)
+
+    def _step(self) -> bool:
+        """One check (and apply, if leader); True once nothing is left to do"""
+        changes = plan()
+        self._record(changes)
+        if not changes:
+            if not self.ready:
+                print("[OPTIMIZATION] Indexes are up to date")
+            self.ready = True
+            return True
+
+        if not self.apply_changes or not acquire_lease(self.owner, self.lease_seconds):
+            return False
+
+        self.leader = True
+        try:
+            print(f"[OPTIMIZATION] Applying {len(changes)} index changes as {self.owner}")
+            self.errors = apply(
+                changes, on_progress=lambda: acquire_lease(self.owner, self.lease_seconds)
+            )
+            self._record(plan())
+        finally:
+            release_lease(self.owner)
+        self.ready = not self.pending
+        # Failed steps are retried on the next poll
+        return self.ready
+
+    def _record(self, changes: List[IndexChange]):
+        self.pending = [change.describe() for change in changes]
+        self.checked_at = datetime.utcnow()
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "mode": "leader" if self.apply_changes else "external",
+            "leader": self.leader,
+            "pending": self.pending,
+            "errors": self.errors,
+            "checked_at": self.checked_at,
+        }
+
+
+# Process-wide instance started by the application
+index_migrator = IndexMigrator(apply_changes=INDEX_MIGRATION_ENABLED)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bring MongoDB indexes in line with the declared spec")
+    parser.add_argument("--check", action="store_true", help="Only print the plan; exit 1 if it is not empty")
+    args = parser.parse_args()
+
+    changes = plan()
+    for change in changes:
+        print(f"[INDEXES] {change.describe()}")
+    if not changes:
+        print("[INDEXES] Up to date")
+        return 0
+    if args.check:
+        return 1
+
+    owner = f"migrate:{socket.gethostname()}:{os.getpid()}"
+    if not acquire_lease(owner, lease_seconds=3600):
+        print("[INDEXES] Another process holds the migration lease; try again later")
+        return 1
+    try:
+        errors = apply(changes)
+    finally:
+        release_lease(owner)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
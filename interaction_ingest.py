@@ -0,0 +1,239 @@
+"""
+Write-behind ingestion for interaction events.
+
+`POST /api/interactions` validates the IDs against in-memory sets, assigns
+the `_id` client-side, queues the document and acknowledges immediately. A
+background thread flushes the queue with `insert_many(ordered=False)` once
+`batch_size` events are waiting or `flush_interval` seconds have passed, then
+hands the stored documents to `on_flushed` (the recommendation hooks).
+
+- If the queue is full, `submit` returns False and the caller writes inline
+- Failed flushes (connection errors) are put back at the head of the queue
+- `stop()` drains the queue; it is called on application shutdown
+
+Set INTERACTION_WRITE_BEHIND=0 to write every event synchronously instead.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+WRITE_BEHIND_ENABLED = os.getenv("INTERACTION_WRITE_BEHIND", "1") != "0"
+
+
+class KnownUserIds:
+    """Set of existing user IDs; unknown IDs are checked against MongoDB once found"""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._ids: Optional[Set[str]] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self._ids = {str(u["_id"]) for u in self._collection.find({}, {"_id": 1})}
+
+    def add(self, user_id: str):
+        """
+        Record a newly created user. Never loads the set (this is called from
+        the event loop): before the first load, or if a load racing with this
+        call misses the ID, `missing()` finds the user with its fallback query.
+        """
+        ids = self._ids
+        if ids is not None:
+            ids.add(user_id)
+
+    def missing(self, user_ids: Iterable[str]) -> Set[str]:
+        """IDs (already valid ObjectId strings) that do not belong to any user"""
+        self._ensure_loaded()
+        unknown = set(user_ids) - self._ids
+        if unknown:
+            found = {
+                str(u["_id"])
+                for u in self._collection.find(
+                    {"_id": {"$in": [ObjectId(uid) for uid in unknown]}}, {"_id": 1}
+                )
+            }
+            self._ids.update(found)
+            unknown -= found
+        return unknown
+
+
+class InteractionIngestQueue:
+    """Buffered, batched writer for interaction documents"""
+
+    def __init__(
+        self,
+        collection,
+        on_flushed: Callable[[List[Dict]], None],
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_queue: int = 100000,
+    ):
+        self._collection = collection
+        self._on_flushed = on_flushed
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+
+        self._queue: deque = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        # Metrics
+        self.enqueued = 0
+        self.flushed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    # ==================== PRODUCER ====================
+
+    def submit(self, document: Dict) -> bool:
+        """Queue a document (with `_id` already set). False if the queue is full."""
+        self.start()
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                return False
+            self._queue.append(document)
+            self.enqueued += 1
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify()
+        return True
+
+    # ==================== FLUSHING ====================
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="interaction-ingest", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the flusher after draining everything still queued"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        # Anything left (e.g. flusher never started) is written here
+        while self.flush():
+            pass
+        if self._queue:
+            print(f"ERROR: {len(self._queue)} interactions could not be written on shutdown")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.time() + self.flush_interval
+                while not self._stopping and len(self._queue) < self.batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                stopping = self._stopping
+
+            try:
+                while self.flush():
+                    if not stopping and len(self._queue) < self.batch_size:
+                        break
+            except Exception as e:
+                # The flusher must outlive any single bad batch
+                print(f"ERROR in interaction flusher: {e}")
+                time.sleep(self.flush_interval)
+
+            if stopping:
+                return
+
+    def flush(self) -> int:
+        """Write up to one batch; returns the number of documents taken off the queue"""
+        with self._flush_lock:
+            with self._condition:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if not batch:
+                return 0
+
+            start = time.time()
+            stored = batch
+            try:
+                self._collection.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # Per-document failures. A duplicate _id means an earlier,
+                # interrupted attempt already stored the document.
+                failed_indexes = {
+                    error["index"]
+                    for error in e.details.get("writeErrors", [])
+                    if error.get("code") != 11000
+                }
+                stored = [doc for i, doc in enumerate(batch) if i not in failed_indexes]
+                self.failed += len(failed_indexes)
+                if failed_indexes:
+                    print(f"[OPTIMIZATION] Interaction flush: {len(failed_indexes)} documents rejected")
+            except PyMongoError as e:
+                # Nothing is known to be stored: put the batch back and retry later
+                with self._condition:
+                    self._queue.extendleft(reversed(batch))
+                print(f"ERROR flushing interactions (will retry): {e}")
+                if self._stopping:
+                    return 0
+                time.sleep(self.flush_interval)
+                return 0
+            except Exception as e:
+                # Raised before anything was sent (e.g. a document BSON cannot
+                # encode): retrying would fail the same way
+                self.failed += len(batch)
+                print(f"ERROR flushing interactions, {len(batch)} documents dropped: {e}")
+                return len(batch)
+
+            elapsed_ms = (time.time() - start) * 1000
+            self.flushes += 1
+            self.flushed += len(stored)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+
+        # Hooks (rollups, recommendation indexes) run apart from the insert:
+        # their failures never put a stored batch back or stop the flusher
+        try:
+            self._on_flushed(stored)
+        except Exception as e:
+            print(f"ERROR in interaction flush hook ({len(stored)} stored interactions not indexed): {e}")
+
+        return len(batch)
+
+    # ==================== METRICS ====================
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "queue_depth": len(self._queue),
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
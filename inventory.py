@@ -0,0 +1,251 @@
+"""
+Atomic stock reservation and order placement for checkout.
+
+Stock is decremented with one `bulk_write` of conditional `$inc` updates
+guarded by `stock_quantity >= qty`, so concurrent checkouts can never drive
+stock below zero.
+
+- On a replica set / sharded cluster the decrements, the order insert and the
+  cart reset run in one multi-document transaction.
+- On a standalone mongod a two-phase scheme is used instead: a marker in
+  `pending_orders` is written first and every decrement tags the product with
+  `reservations.<order_id>`. If any item is short, the tagged decrements are
+  reverted, as they are when a write fails part-way. Markers left behind by
+  a crash are resolved by `recover_pending_orders` (rolled back, or cleaned
+  up if the order exists), which the application runs periodically.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import PyMongoError
+
+from database import carts_collection, client, db, orders_collection, products_collection
+
+pending_orders = db["pending_orders"]
+
+PENDING_ORDER_RECOVERY_SECONDS = float(os.getenv("PENDING_ORDER_RECOVERY_SECONDS", "60"))
+
+_transactions_supported = None
+_recovery_thread = None
+_recovery_stop = threading.Event()
+
+
+class OutOfStock(Exception):
+    """One or more items could not be reserved"""
+
+    def __init__(self, product_ids: List[str]):
+        super().__init__(f"Not enough stock for {', '.join(product_ids)}")
+        self.product_ids = product_ids
+
+
+def supports_transactions() -> bool:
+    """True when connected to a replica set or mongos (checked once)"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        try:
+            hello = client.admin.command("hello")
+            _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except PyMongoError:
+            _transactions_supported = False
+        print(
+            "[OPTIMIZATION] Checkout mode: "
+            + ("transactions" if _transactions_supported else "two-phase reservations")
+        )
+    return _transactions_supported
+
+
+def _decrement_ops(quantities: Dict[str, int], order_id: ObjectId = None) -> List[UpdateOne]:
+    operations = []
+    for product_id, quantity in quantities.items():
+        query = {"_id": ObjectId(product_id), "stock_quantity": {"$gte": quantity}}
+        update = {"$inc": {"stock_quantity": -quantity}}
+        if order_id is not None:
+            tag = f"reservations.{order_id}"
+            query[tag] = {"$exists": False}
+            update["$set"] = {tag: quantity}
+        operations.append(UpdateOne(query, update))
+    return operations
+
+
+def _short_items(quantities: Dict[str, int]) -> List[str]:
+    """Products whose current stock cannot cover the requested quantity"""
+    stock = {
+        str(p["_id"]): p.get("stock_quantity", 0)
+        for p in products_collection.find(
+            {"_id": {"$in": [ObjectId(pid) for pid in quantities]}},
+            {"stock_quantity": 1},
+        )
+    }
+    return [pid for pid, quantity in quantities.items() if stock.get(pid, 0) < quantity]
+
+
+def place_order(order: Dict, quantities: Dict[str, int]) -> ObjectId:
+    """
+    Reserve `quantities` (product_id -> qty), insert `order` and empty the
+    user's cart. Raises OutOfStock if any item is short; nothing is changed
+    in that case.
+    """
+    order.setdefault("_id", ObjectId())
+
+    if supports_transactions():
+        with client.start_session() as session:
+            session.with_transaction(lambda s: _place_in_transaction(s, order, quantities))
+    else:
+        _place_two_phase(order, quantities)
+
+    return order["_id"]
+
+
+def _place_in_transaction(session, order: Dict, quantities: Dict[str, int]):
+    result = products_collection.bulk_write(
+        _decrement_ops(quantities), ordered=False, session=session
+    )
+    if result.modified_count != len(quantities):
+        # Raising aborts the transaction: no decrement is kept. Stock is read
+        # outside the session, i.e. without this transaction's own decrements
+        raise OutOfStock(_short_items(quantities) or list(quantities))
+
+    orders_collection.insert_one(order, session=session)
+    carts_collection.update_one(
+        {"user_id": order["user_id"]},
+        {"$set": {"items": [], "updated_at": datetime.utcnow()}},
+        session=session,
+    )
+
+
+def _place_two_phase(order: Dict, quantities: Dict[str, int]):
+    order_id = order["_id"]
+
+    # Phase 1: record intent, then reserve every item in one round-trip
+    pending_orders.insert_one({
+        "_id": order_id,
+        "user_id": order["user_id"],
+        "quantities": quantities,
+        "created_at": datetime.utcnow(),
+    })
+
+    try:
+        result = products_collection.bulk_write(
+            _decrement_ops(quantities, order_id), ordered=False
+        )
+    except PyMongoError:
+        # Some decrements may have been applied: give back the tagged ones
+        _compensate(order_id, quantities)
+        raise
+
+    if result.modified_count != len(quantities):
+        _compensate(order_id, quantities)
+        raise OutOfStock(_short_items(quantities) or list(quantities))
+
+    try:
+        orders_collection.insert_one(order)
+    except PyMongoError:
+        # The insert may have reached the server before the error
+        exists = _order_exists(order_id)
+        if exists is None:
+            # Outcome unknown: keep the marker and the reservation for recover_pending_orders
+            raise
+        if not exists:
+            _compensate(order_id, quantities)
+            raise
+
+    # Phase 2: the order exists from here on; drop the reservation tags
+    _release(order_id, quantities, restore_stock=False)
+    carts_collection.update_one(
+        {"user_id": order["user_id"]},
+        {"$set": {"items": [], "updated_at": datetime.utcnow()}},
+    )
+    pending_orders.delete_one({"_id": order_id})
+
+
+def _order_exists(order_id: ObjectId) -> Optional[bool]:
+    """True / False, or None if the check itself failed"""
+    try:
+        return orders_collection.count_documents({"_id": order_id}, limit=1) > 0
+    except PyMongoError:
+        return None
+
+
+def _compensate(order_id: ObjectId, quantities: Dict[str, int]):
+    """Undo a failed two-phase checkout; on error the marker stays for recovery"""
+    try:
+        _release(order_id, quantities, restore_stock=True)
+        pending_orders.delete_one({"_id": order_id})
+    except PyMongoError as e:
+        print(f"ERROR rolling back checkout {order_id} (left for recovery): {e}")
+
+
+def _release(order_id: ObjectId, quantities: Dict[str, int], restore_stock: bool):
+    """Remove this order's reservation tags, optionally giving the stock back (idempotent)"""
+    tag = f"reservations.{order_id}"
+    product_ids = [ObjectId(pid) for pid in quantities]
+
+    if restore_stock:
+        operations = [
+            UpdateOne(
+                {"_id": ObjectId(product_id), tag: {"$exists": True}},
+                {"$inc": {"stock_quantity": quantity}, "$unset": {tag: ""}},
+            )
+            for product_id, quantity in quantities.items()
+        ]
+    else:
+        operations = [UpdateMany({"_id": {"$in": product_ids}, tag: {"$exists": True}}, {"$unset": {tag: ""}})]
+
+    # Drop the emptied `reservations` object so product documents stay clean
+    operations.append(
+        UpdateMany({"_id": {"$in": product_ids}, "reservations": {}}, {"$unset": {"reservations": ""}})
+    )
+    products_collection.bulk_write(operations, ordered=True)
+
+
+def recover_pending_orders(max_age_seconds: float = 60.0) -> int:
+    """
+    Resolve two-phase checkouts interrupted by a crash: roll back the
+    reservations of orders that were never written, clean up the rest.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    recovered = 0
+
+    for marker in pending_orders.find({"created_at": {"$lt": cutoff}}):
+        order_id = marker["_id"]
+        placed = orders_collection.count_documents({"_id": order_id}, limit=1) > 0
+        _release(order_id, marker.get("quantities", {}), restore_stock=not placed)
+        pending_orders.delete_one({"_id": order_id})
+        recovered += 1
+
+    if recovered:
+        print(f"[OPTIMIZATION] Recovered {recovered} interrupted checkouts")
+    return recovered
+
+
+def start_recovery(interval_seconds: float = PENDING_ORDER_RECOVERY_SECONDS):
+    """Run `recover_pending_orders` now and then every `interval_seconds` in a daemon thread"""
+    global _recovery_thread
+    if _recovery_thread is not None and _recovery_thread.is_alive():
+        return
+    _recovery_stop.clear()
+
+    def run():
+        while True:
+            try:
+                recover_pending_orders()
+            except PyMongoError as e:
+                print(f"ERROR recovering pending orders: {e}")
+            if _recovery_stop.wait(interval_seconds):
+                return
+
+    _recovery_thread = threading.Thread(target=run, name="pending-order-recovery", daemon=True)
+    _recovery_thread.start()
+
+
+def stop_recovery():
+    global _recovery_thread
+    _recovery_stop.set()
+    if _recovery_thread is not None:
+        _recovery_thread.join(timeout=5)
+        _recovery_thread = None
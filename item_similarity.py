@@ -0,0 +1,354 @@
+"""
+Precomputed item-item similarity index.
+
+Keeps, for every product, its top-K most similar products by cosine similarity
+over binary user co-occurrence:
+
+    sim(i, j) = users(i ∩ j) / sqrt(users(i) * users(j))
+
+The full index is built from the interactions collection with one sparse
+product (B^T B), kept in memory and persisted to the `item_similarity`
+collection. New interactions update the co-occurrence counts incrementally and
+re-rank only the neighbour lists whose top-K can change; a periodic full
+rebuild picks up anything written by other processes.
+
+A new process serves the persisted neighbour lists right away and builds the
+full index in a background thread; the same thread rebuilds it once it is
+older than `refresh_seconds`. MongoDB I/O never happens under the lock that
+`add_interaction` takes, nor on the thread that calls it: changed lists are
+written by a background persist at most every `persist_seconds`. Products
+left without neighbours are deleted from the collection, as are, after a
+full build, products that no longer appear in the index.
+"""
+
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import PyMongoError
+from scipy import sparse
+
+
+def _top_k(
+    product_id: str, item_counts: Dict[str, int], co_counts: Dict[str, Dict[str, int]], k: int
+) -> List[Tuple[str, float]]:
+    count = item_counts.get(product_id, 0)
+    if not count:
+        return []
+
+    scored = (
+        (other_id, co / math.sqrt(count * item_counts[other_id]))
+        for other_id, co in co_counts.get(product_id, {}).items()
+        if item_counts.get(other_id)
+    )
+    return heapq.nlargest(k, scored, key=lambda x: x[1])
+
+
+class ItemSimilarityIndex:
+    """In-memory top-K item neighbours with incremental refresh"""
+
+    def __init__(
+        self,
+        interactions_collection,
+        similarity_collection,
+        top_k: int = 20,
+        refresh_seconds: float = 3600.0,
+        persist_seconds: float = 30.0,
+    ):
+        self._interactions = interactions_collection
+        self._similarity = similarity_collection
+        self.top_k = top_k
+        self.refresh_seconds = refresh_seconds
+        self.persist_seconds = persist_seconds
+
+        # _lock guards the in-memory state; _build_lock serializes full builds,
+        # which scan and rank without holding _lock
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._built_at: Optional[float] = None
+        self._refreshing = False
+        self._persisting = False
+        self._last_persist = 0.0
+        self._dirty = set()
+        # Interactions added while a build is scanning, replayed onto its result
+        self._missed: Optional[List[Tuple[str, str]]] = None
+
+        self._user_items: Dict[str, set] = defaultdict(set)
+        self._item_counts: Dict[str, int] = defaultdict(int)
+        self._co_counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._neighbours: Dict[str, List[Tuple[str, float]]] = {}
+
+    # ==================== BUILD ====================
+
+    def build(self, persist: bool = True):
+        """Rebuild the whole index from interactions and (by default) persist it"""
+        with self._build_lock:
+            start = time.time()
+            with self._lock:
+                self._missed = []
+            try:
+                user_items, item_counts, co_counts = self._scan()
+                neighbours = {
+                    pid: _top_k(pid, item_counts, co_counts, self.top_k) for pid in co_counts
+                }
+            except Exception:
+                with self._lock:
+                    self._missed = None
+                raise
+
+            with self._lock:
+                self._user_items = user_items
+                self._item_counts = item_counts
+                self._co_counts = co_counts
+                self._neighbours = neighbours
+                self._built_at = time.time()
+                self._loaded = True
+                self._dirty = set(co_counts)
+
+                missed, self._missed = self._missed, None
+                for user_id, product_id in missed:
+                    self._fold(user_id, product_id)
+
+            if persist:
+                # Rewrites every list, then drops documents of products no longer indexed
+                self._persist_in_background(full=True)
+
+            print(
+                f"[OPTIMIZATION] Item similarity index built: {len(co_counts)} products "
+                f"in {(time.time() - start) * 1000:.1f}ms"
+            )
+
+    def _scan(self):
+        """Co-occurrence counts from one interactions scan and one sparse product"""
+        user_items: Dict[str, set] = defaultdict(set)
+        cursor = self._interactions.find({}, {"_id": 0, "user_id": 1, "product_id": 1})
+        for interaction in cursor:
+            user_id = interaction.get("user_id")
+            product_id = interaction.get("product_id")
+            if user_id and product_id:
+                user_items[user_id].add(product_id)
+
+        product_ids = sorted({pid for items in user_items.values() for pid in items})
+        product_index = {pid: j for j, pid in enumerate(product_ids)}
+
+        rows, cols = [], []
+        for row, items in enumerate(user_items.values()):
+            for product_id in items:
+                rows.append(row)
+                cols.append(product_index[product_id])
+
+        binary = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+            shape=(len(user_items), len(product_ids)),
+        )
+        co_matrix = (binary.T @ binary).tocsr()
+
+        item_counts: Dict[str, int] = defaultdict(int)
+        co_counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for i, product_id in enumerate(product_ids):
+            start_ptr, end_ptr = co_matrix.indptr[i], co_matrix.indptr[i + 1]
+            row = {}
+            for j, count in zip(co_matrix.indices[start_ptr:end_ptr], co_matrix.data[start_ptr:end_ptr]):
+                if j == i:
+                    item_counts[product_id] = int(count)
+                else:
+                    row[product_ids[j]] = int(count)
+            co_counts[product_id] = row
+
+        return user_items, item_counts, co_counts
+
+    def load_persisted(self) -> bool:
+        """Serve the neighbour lists persisted by an earlier build; False if there are none"""
+        start = time.time()
+        try:
+            neighbours = {
+                doc["_id"]: [(n["product_id"], n["score"]) for n in doc.get("neighbours", [])]
+                for doc in self._similarity.find({}, {"neighbours": 1})
+            }
+        except PyMongoError as e:
+            print(f"[OPTIMIZATION] Warning: could not load item similarity: {e}")
+            return False
+        if not neighbours:
+            return False
+
+        with self._lock:
+            if self._built_at is None:
+                self._neighbours = neighbours
+            self._loaded = True
+
+        print(
+            f"[OPTIMIZATION] Item similarity loaded from MongoDB: {len(neighbours)} products "
+            f"in {(time.time() - start) * 1000:.1f}ms"
+        )
+        return True
+
+    def neighbour_lists(self) -> Dict[str, List[Tuple[str, float]]]:
+        """Every product's current neighbour list"""
+        with self._lock:
+            return dict(self._neighbours)
+
+    def install(self, neighbours: Dict[str, List[Tuple[str, float]]]):
+        """Serve neighbour lists computed elsewhere (e.g. by a parent process); never rebuilt here"""
+        with self._lock:
+            self.refresh_seconds = float("inf")
+            self._neighbours = neighbours
+            self._loaded = True
+            self._built_at = time.time()
+
+    def is_built(self) -> bool:
+        """True once neighbour lists are available (`ensure_built()` will not block)"""
+        return self._loaded
+
+    def ensure_built(self):
+        """
+        On first use, serve the persisted lists (building synchronously only if
+        there are none). A full build then runs in the background, and again
+        whenever the index is older than refresh_seconds.
+        """
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded and not self.load_persisted():
+                    self.build()
+                    return
+
+        built_at = self._built_at
+        if built_at is None or time.time() - built_at >= self.refresh_seconds:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="item-similarity", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.build()
+        except Exception as e:
+            print(f"ERROR refreshing item similarity index: {e}")
+        finally:
+            self._refreshing = False
+
+    # ==================== INCREMENTAL UPDATES ====================
+
+    def add_interaction(self, user_id: str, product_id: str):
+        """Fold one new interaction into the co-occurrence counts"""
+        if not user_id or not product_id:
+            return
+
+        with self._lock:
+            if self._missed is not None:
+                self._missed.append((user_id, product_id))
+            # Nothing to update until the first build has happened
+            if self._built_at is None:
+                return
+            self._fold(user_id, product_id)
+            persist_due = time.time() - self._last_persist >= self.persist_seconds
+
+        if persist_due:
+            self._persist_in_background()
+
+    def _fold(self, user_id: str, product_id: str):
+        """Update counts and affected neighbour lists (caller holds _lock)"""
+        history = self._user_items[user_id]
+        if product_id in history:
+            return
+
+        self._item_counts[product_id] += 1
+        row = self._co_counts[product_id]
+        for other_id in history:
+            row[other_id] = row.get(other_id, 0) + 1
+            other_row = self._co_counts[other_id]
+            other_row[product_id] = other_row.get(product_id, 0) + 1
+
+        # Lists that can change: the product itself, products whose
+        # co-occurrence with it grew, and products that currently rank it
+        # (its similarity to everyone else dropped as its count grew)
+        affected = {product_id}
+        affected.update(history)
+        for other_id in row:
+            if other_id not in affected and any(
+                neighbour_id == product_id
+                for neighbour_id, _ in self._neighbours.get(other_id, [])
+            ):
+                affected.add(other_id)
+        history.add(product_id)
+
+        for affected_id in affected:
+            self._neighbours[affected_id] = _top_k(
+                affected_id, self._item_counts, self._co_counts, self.top_k
+            )
+        self._dirty.update(affected)
+
+    # ==================== PERSISTENCE ====================
+
+    def persist(self, full: bool = False):
+        """
+        Write neighbour lists changed since the last persist to MongoDB and
+        delete empty ones. `full` (after a build, when every list is dirty)
+        also deletes documents this persist did not write.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._last_persist = time.time()
+            now = datetime.utcnow()
+            operations = []
+            for product_id in dirty:
+                neighbours = self._neighbours.get(product_id)
+                if not neighbours:
+                    operations.append(DeleteOne({"_id": product_id}))
+                    continue
+                operations.append(ReplaceOne(
+                    {"_id": product_id},
+                    {
+                        "_id": product_id,
+                        "neighbours": [
+                            {"product_id": other_id, "score": score}
+                            for other_id, score in neighbours
+                        ],
+                        "updated_at": now,
+                    },
+                    upsert=True,
+                ))
+
+        try:
+            if operations:
+                self._similarity.bulk_write(operations, ordered=False)
+            if full:
+                self._similarity.delete_many({"updated_at": {"$lt": now}})
+        except Exception as e:
+            with self._lock:
+                self._dirty.update(dirty)
+            print(f"[OPTIMIZATION] Warning: could not persist item similarity: {e}")
+
+    def _persist_in_background(self, full: bool = False):
+        with self._lock:
+            if self._persisting and not full:
+                # The running persist or the next one picks up these changes
+                return
+            self._persisting = True
+        threading.Thread(
+            target=self._persist_worker, args=(full,), name="item-similarity-persist", daemon=True
+        ).start()
+
+    def _persist_worker(self, full: bool):
+        try:
+            self.persist(full)
+        finally:
+            self._persisting = False
+
+    # ==================== QUERIES ====================
+
+    def neighbours(self, product_id: str) -> List[Tuple[str, float]]:
+        """Top-K (product_id, similarity) pairs for a product"""
+        self.ensure_built()
+        return self._neighbours.get(product_id, [])
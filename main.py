@@ -1,18 +1,28 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, ValidationError
 from typing import Optional, List
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-import bcrypt
+import asyncio
+import csv
+import io
+import json
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
 from bson import ObjectId
 import os
 import secrets
 import smtplib
+import sys
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 # Import shared MongoDB connection and collections
+import analytics_rollups
+import database
 from database import (
     client,
     db,
@@ -23,8 +33,50 @@ from database import (
     orders_collection,
     password_reset_tokens,
 )
+from admin_stats import admin_stats_cache
+from async_database import close_async_client, get_async_db
+from catalog import catalog
+from indexes import index_migrator
+from interaction_ingest import WRITE_BEHIND_ENABLED, InteractionIngestQueue, KnownUserIds
+from inventory import OutOfStock, place_order, start_recovery, stop_recovery
+from pagination import decode_cursor, encode_cursor, parse_fields
+from password_hashing import PasswordHasherBusy, password_hasher
+from product_cache import product_cache
+from recommendation_routes import invalidate_product, record_interactions
+from search_index import product_search_index
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+    except:
+        pass
 
-app = FastAPI(title="E-commerce Recommendation API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect and start background workers on startup; drain and disconnect on shutdown"""
+    startup()
+    try:
+        yield
+    finally:
+        shutdown()
+
+
+app = FastAPI(title="E-commerce Recommendation API", lifespan=lifespan)
+
+# Write-behind interaction ingestion (recommendation and rollup hooks run at flush time)
+known_users = KnownUserIds(users_collection)
+def on_interactions_stored(interactions: List[dict]):
+    """Feed stored interactions to the recommendation state and the analytics rollups"""
+    record_interactions(interactions)
+    try:
+        analytics_rollups.record_interactions(interactions)
+    except PyMongoError as e:
+        print(f"ERROR updating interaction rollups: {e}")
+
+
+interaction_queue = InteractionIngestQueue(interactions_collection, on_flushed=on_interactions_stored)
 
 # CORS
 app.add_middleware(
@@ -102,13 +154,23 @@ class ProductUpdate(BaseModel):
 
 
 # Helper function
-def hash_password(password: str) -> str:
-    # Using 10 rounds for better performance while maintaining security
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=10)).decode("utf-8")
+async def hash_password(password: str) -> str:
+    """bcrypt in the password hashing pool; 503 when the pool is saturated"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"}
+        )
 
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return await password_hasher.verify(password, hashed)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"}
+        )
 
 
 def generate_reset_token() -> str:
@@ -142,26 +204,42 @@ def root():
     }
 
 
+@app.get("/api/health/ready")
+def readiness():
+    """200 once MongoDB answers and the declared indexes are in place, 503 until then"""
+    status = index_migrator.status()
+    try:
+        client.admin.command("ping")
+        status["database"] = "ok"
+    except PyMongoError as e:
+        status["database"] = str(e)
+        status["ready"] = False
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=jsonable_encoder(status))
+
+
 # User Registration
 @app.post("/api/register")
-def register_user(user: UserRegister):
+async def register_user(user: UserRegister):
+    users = get_async_db().users
+
     # Check if user exists
-    if users_collection.find_one({"email": user.email}):
+    if await users.find_one({"email": user.email}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    if users_collection.find_one({"username": user.username}):
+    if await users.find_one({"username": user.username}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="Username already taken")
 
     # Create user
     user_doc = {
         "username": user.username,
         "email": user.email,
-        "password_hash": hash_password(user.password),
+        "password_hash": await hash_password(user.password),
         "preferences": user.preferences,
         "created_at": datetime.utcnow(),
     }
 
-    result = users_collection.insert_one(user_doc)
+    result = await users.insert_one(user_doc)
+    known_users.add(str(result.inserted_id))
 
     return {
         "message": "User registered successfully",
@@ -172,10 +250,13 @@ def register_user(user: UserRegister):
 
 # User Login
 @app.post("/api/login")
-def login_user(credentials: UserLogin):
-    user = users_collection.find_one({"email": credentials.email})
+async def login_user(credentials: UserLogin):
+    user = await get_async_db().users.find_one(
+        {"email": credentials.email},
+        {"password_hash": 1, "username": 1, "is_admin": 1},
+    )
 
-    if not user or not verify_password(credentials.password, user["password_hash"]):
+    if not user or not await verify_password(credentials.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     return {
@@ -186,6 +267,12 @@ def login_user(credentials: UserLogin):
     }
 
 
+@app.get("/api/auth/hashing/stats")
+def get_password_hashing_stats():
+    """Password hashing pool load and queue times"""
+    return password_hasher.stats()
+
+
 # Get User Profile
 @app.get("/api/users/{user_id}")
 def get_user_profile(user_id: str):
@@ -249,10 +336,19 @@ def update_user_profile(user_id: str, update_data: UserUpdate):
 
 # Get User History (all interactions with details)
 @app.get("/api/users/{user_id}/history")
-def get_user_history(user_id: str, interaction_type: Optional[str] = None):
+def get_user_history(
+    user_id: str,
+    interaction_type: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    include_counts: bool = False,
+):
     """
-    Get user's interaction history with product details
+    Get user's interaction history with product details, newest first
     Optional filter by interaction_type: view, like, rating
+
+    - `before`: `next_cursor` of the previous page
+    - `include_counts`: also return the number of interactions per type
     """
     try:
         # Build query
@@ -260,65 +356,208 @@ def get_user_history(user_id: str, interaction_type: Optional[str] = None):
         if interaction_type:
             query["interaction_type"] = interaction_type
 
-        # Get interactions sorted by timestamp (newest first)
-        interactions = list(interactions_collection.find(query).sort("timestamp", -1))
+        if before:
+            cursor_values = decode_cursor(before)
+            try:
+                timestamp = datetime.fromisoformat(cursor_values["ts"])
+                last_id = ObjectId(cursor_values["id"])
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": last_id}},
+            ]
+
+        # One page of interactions on the (user_id, timestamp, _id) index: no in-memory sort
+        interactions = list(
+            interactions_collection.find(
+                query, {"product_id": 1, "interaction_type": 1, "rating": 1, "timestamp": 1}
+            )
+            .sort([("timestamp", -1), ("_id", -1)])
+            .limit(limit + 1)
+        )
+
+        next_cursor = None
+        if len(interactions) > limit:
+            interactions = interactions[:limit]
+            last = interactions[-1]
+            next_cursor = encode_cursor({"ts": last["timestamp"].isoformat(), "id": str(last["_id"])})
+
+        # Enrich with product details: one batched lookup for the whole page
+        products = product_cache.get_many(i["product_id"] for i in interactions)
 
-        # Enrich with product details
         history = []
         for interaction in interactions:
-            try:
-                product = products_collection.find_one(
-                    {"_id": ObjectId(interaction["product_id"])}
-                )
-                if product:
-                    history_item = {
-                        "_id": str(interaction["_id"]),
-                        "interaction_type": interaction["interaction_type"],
-                        "rating": interaction.get("rating"),
-                        "timestamp": interaction["timestamp"],
-                        "product": {
-                            "_id": str(product["_id"]),
-                            "name": product["name"],
-                            "description": product["description"],
-                            "category": product["category"],
-                            "price": product["price"],
-                            "image_url": product.get("image_url", ""),
-                        },
-                    }
-                    history.append(history_item)
-            except:
-                continue
+            product = products.get(interaction["product_id"])
+            if product:
+                history_item = {
+                    "_id": str(interaction["_id"]),
+                    "interaction_type": interaction["interaction_type"],
+                    "rating": interaction.get("rating"),
+                    "timestamp": interaction["timestamp"],
+                    "product": {
+                        "_id": product["_id"],
+                        "name": product["name"],
+                        "description": product["description"],
+                        "category": product["category"],
+                        "price": product["price"],
+                        "image_url": product.get("image_url", ""),
+                    },
+                }
+                history.append(history_item)
 
-        return {"user_id": user_id, "history": history, "count": len(history)}
+        response = {
+            "user_id": user_id,
+            "history": history,
+            "count": len(history),
+            "next_cursor": next_cursor,
+        }
+
+        if include_counts:
+            # Covered by the (user_id, interaction_type) index
+            response["counts"] = {
+                row["_id"]: row["count"]
+                for row in interactions_collection.aggregate([
+                    {"$match": {"user_id": user_id}},
+                    {"$group": {"_id": "$interaction_type", "count": {"$sum": 1}}},
+                ])
+            }
+
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+PRODUCT_FIELDS = ("name", "description", "category", "price", "image_url", "stock_quantity", "created_at")
+
+
+def _cursor_object_id(values: dict) -> ObjectId:
+    try:
+        return ObjectId(values["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def search_products(
+    search: str,
+    category: Optional[str],
+    limit: int,
+    after: Optional[dict] = None,
+    projection: Optional[dict] = None,
+):
+    """
+    Relevance-ranked search on the weighted `product_text` index, ordered by
+    (score desc, _id asc). Falls back to the in-process index (prefix and typo
+    matching) when `$text` finds nothing or the index is unavailable.
+
+    `after` is the decoded cursor of the previous page; it pins the mode so a
+    query does not switch between the two result sets while paging.
+    Returns (products, mode).
+    """
+    mode = after.get("mode", "text") if after else "text"
+
+    if mode == "text":
+        match = {"$text": {"$search": search}}
+        if category:
+            match["category"] = category
+
+        pipeline = [{"$match": match}, {"$addFields": {"score": {"$meta": "textScore"}}}]
+        if after:
+            pipeline.append({"$match": {"$or": [
+                {"score": {"$lt": after["score"]}},
+                {"score": after["score"], "_id": {"$gt": _cursor_object_id(after)}},
+            ]}})
+        pipeline += [{"$sort": {"score": -1, "_id": 1}}, {"$limit": limit}]
+        if projection:
+            pipeline.append({"$project": {**projection, "score": 1}})
+
+        try:
+            products = list(products_collection.aggregate(pipeline))
+        except OperationFailure as e:
+            print(f"[OPTIMIZATION] $text search unavailable, using in-process index: {e}")
+            products = []
+
+        if products or after:
+            return products, mode
+        mode = "fuzzy"
+
+    ranked = product_search_index.search(search, category, limit=None)
+    if after:
+        after_key = (-after["score"], after["id"])
+        ranked = [(product_id, score) for product_id, score in ranked if (-score, product_id) > after_key]
+    ranked = ranked[:limit]
+
+    found = product_cache.get_many(product_id for product_id, _ in ranked)
+    products = []
+    for product_id, score in ranked:
+        product = found.get(product_id)
+        if product:
+            if projection:
+                product = {key: value for key, value in product.items() if key == "_id" or key in projection}
+            product["score"] = score
+            products.append(product)
+    return products, mode
+
+
 # Get all products
 @app.get("/api/products")
-def get_products(category: Optional[str] = None, search: Optional[str] = None):
+def get_products(
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    List or search products with keyset pagination.
+
+    - `after`: `next_cursor` from the previous page
+    - `fields`: comma-separated projection, e.g. `name,price,image_url`
+    """
     import time
     start_total = time.time()
 
-    query = {}
-
-    if category:
-        query["category"] = category
-
-    if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-        ]
-
+    projection = parse_fields(fields, PRODUCT_FIELDS)
+    cursor_values = decode_cursor(after) if after else None
+    if search and cursor_values and (
+        cursor_values.get("mode") not in ("text", "fuzzy")
+        or not isinstance(cursor_values.get("score"), (int, float))
+        or not isinstance(cursor_values.get("id"), str)
+    ):
+        # e.g. a cursor from the plain listing, which has no relevance score
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Fetch one extra product to know whether there is a next page
     start_query = time.time()
-    products = list(products_collection.find(query).limit(50))
+    mode = None
+    if search:
+        products, mode = search_products(search, category, limit + 1, cursor_values, projection)
+    else:
+        query = {}
+        if category:
+            query["category"] = category
+        if cursor_values:
+            query["_id"] = {"$gt": _cursor_object_id(cursor_values)}
+        products = list(products_collection.find(query, projection).sort("_id", 1).limit(limit + 1))
     query_time = (time.time() - start_query) * 1000
 
     print(f"[TIMING] Database query took: {query_time:.1f}ms")
 
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        last = products[-1]
+        cursor = {"id": str(last["_id"])}
+        if search:
+            cursor.update(mode=mode, score=last["score"])
+        next_cursor = encode_cursor(cursor)
+
     for product in products:
         product["_id"] = str(product["_id"])
+        # Relevance is internal to paging (it is in the cursor)
+        product.pop("score", None)
 
     total_time = (time.time() - start_total) * 1000
     print(f"[TIMING] Total endpoint time: {total_time:.1f}ms")
@@ -326,6 +565,7 @@ def get_products(category: Optional[str] = None, search: Optional[str] = None):
     return {
         "products": products,
         "count": len(products),
+        "next_cursor": next_cursor,
         "_debug_timing": {
             "database_query_ms": round(query_time, 1),
             "total_endpoint_ms": round(total_time, 1)
@@ -337,14 +577,19 @@ def get_products(category: Optional[str] = None, search: Optional[str] = None):
 @app.get("/api/products/{product_id}")
 def get_product(product_id: str):
     try:
-        product = products_collection.find_one({"_id": ObjectId(product_id)})
+        object_id = ObjectId(product_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid product ID")
+
+    # Served from the catalog snapshot; MongoDB only for products it hasn't seen yet
+    product = catalog.get(product_id)
+    if product is None:
+        product = products_collection.find_one({"_id": object_id})
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
-
         product["_id"] = str(product["_id"])
-        return product
-    except:
-        raise HTTPException(status_code=400, detail="Invalid product ID")
+
+    return product
 
 
 # Create product (for admin/testing)
@@ -354,26 +599,46 @@ def create_product(product: Product):
     product_doc["created_at"] = datetime.utcnow()
 
     result = products_collection.insert_one(product_doc)
+    catalog.refresh_product(str(result.inserted_id))
+    product_search_index.invalidate()
 
     return {"message": "Product created", "product_id": str(result.inserted_id)}
 
 
+def missing_product_ids(product_ids) -> set:
+    """IDs (valid ObjectId strings) of products that don't exist; catalog first, then one `$in`"""
+    unknown = set(product_ids)
+    unknown -= set(catalog.lookup(unknown))
+    if unknown:
+        found = {
+            str(p["_id"])
+            for p in products_collection.find(
+                {"_id": {"$in": [ObjectId(pid) for pid in unknown]}}, {"_id": 1}
+            )
+        }
+        unknown -= found
+    return unknown
+
+
 # Track interaction
 @app.post("/api/interactions")
 def track_interaction(interaction: Interaction):
-    # Validate user and product exist
+    """
+    Validate against cached user/product IDs and queue the event; it is
+    written in the next batch (see interaction_ingest.py).
+    """
     try:
-        user = users_collection.find_one({"_id": ObjectId(interaction.user_id)})
-        product = products_collection.find_one(
-            {"_id": ObjectId(interaction.product_id)}
-        )
-
-        if not user or not product:
-            raise HTTPException(status_code=404, detail="User or Product not found")
-    except:
+        ObjectId(interaction.user_id)
+        ObjectId(interaction.product_id)
+    except Exception:
         raise HTTPException(status_code=400, detail="Invalid ID")
 
+    # Validate user and product exist
+    if known_users.missing([interaction.user_id]) or missing_product_ids([interaction.product_id]):
+        raise HTTPException(status_code=404, detail="User or Product not found")
+
     interaction_doc = {
+        "_id": ObjectId(),
         "user_id": interaction.user_id,
         "product_id": interaction.product_id,
         "interaction_type": interaction.interaction_type,
@@ -381,9 +646,158 @@ def track_interaction(interaction: Interaction):
         "timestamp": datetime.utcnow(),
     }
 
-    result = interactions_collection.insert_one(interaction_doc)
+    if WRITE_BEHIND_ENABLED and interaction_queue.submit(interaction_doc):
+        return {"message": "Interaction tracked", "interaction_id": str(interaction_doc["_id"])}
+
+    # Write-behind disabled or queue full: write inline
+    interactions_collection.insert_one(interaction_doc)
+
+    # Keep incremental recommendation indexes and rollups up to date
+    on_interactions_stored([interaction_doc])
 
-    return {"message": "Interaction tracked", "interaction_id": str(result.inserted_id)}
+    return {"message": "Interaction tracked", "interaction_id": str(interaction_doc["_id"])}
+
+
+MAX_BULK_INTERACTIONS = 10000
+# Generous 1 KiB per interaction: caps what is buffered before items can be counted
+MAX_BULK_BODY_BYTES = MAX_BULK_INTERACTIONS * 1024
+
+
+async def _read_bulk_items(request: Request) -> List:
+    """
+    Parse the bulk body while it streams in. Oversized requests are rejected
+    with 413 from Content-Length before reading, or as soon as the byte limit
+    (or, for NDJSON, the item limit) is crossed.
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_BULK_BODY_BYTES:
+        raise HTTPException(status_code=413, detail=f"Body larger than {MAX_BULK_BODY_BYTES} bytes")
+
+    content_type = request.headers.get("content-type", "")
+    ndjson = "ndjson" in content_type or "jsonlines" in content_type
+
+    items, chunks, pending, received = [], [], b"", 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > MAX_BULK_BODY_BYTES:
+            raise HTTPException(status_code=413, detail=f"Body larger than {MAX_BULK_BODY_BYTES} bytes")
+        if not ndjson:
+            chunks.append(chunk)
+            continue
+
+        *lines, pending = (pending + chunk).split(b"\n")
+        items.extend(json.loads(line) for line in lines if line.strip())
+        if len(items) > MAX_BULK_INTERACTIONS:
+            raise HTTPException(
+                status_code=413, detail=f"At most {MAX_BULK_INTERACTIONS} interactions per request"
+            )
+
+    if not ndjson:
+        return json.loads(b"".join(chunks))
+    if pending.strip():
+        items.append(json.loads(pending))
+    return items
+
+
+def _ingest_interactions(raw_items: List) -> dict:
+    """Validate and store a batch of interactions (two `$in` checks, one insert_many)"""
+    results = [None] * len(raw_items)
+    candidates = []
+
+    for index, raw in enumerate(raw_items):
+        try:
+            interaction = Interaction.model_validate(raw)
+        except ValidationError:
+            results[index] = {"index": index, "status": "error", "error": "Invalid interaction"}
+            continue
+        try:
+            user_oid = ObjectId(interaction.user_id)
+            product_oid = ObjectId(interaction.product_id)
+        except Exception:
+            results[index] = {"index": index, "status": "error", "error": "Invalid ID"}
+            continue
+        candidates.append((index, interaction, user_oid, product_oid))
+
+    # Two queries validate every user and product in the batch
+    existing_users = {
+        str(u["_id"])
+        for u in users_collection.find({"_id": {"$in": list({c[2] for c in candidates})}}, {"_id": 1})
+    } if candidates else set()
+    existing_products = {
+        str(p["_id"])
+        for p in products_collection.find({"_id": {"$in": list({c[3] for c in candidates})}}, {"_id": 1})
+    } if candidates else set()
+
+    now = datetime.utcnow()
+    documents, document_indexes = [], []
+    for index, interaction, _, _ in candidates:
+        if interaction.user_id not in existing_users or interaction.product_id not in existing_products:
+            results[index] = {"index": index, "status": "error", "error": "User or Product not found"}
+            continue
+        documents.append({
+            "_id": ObjectId(),
+            "user_id": interaction.user_id,
+            "product_id": interaction.product_id,
+            "interaction_type": interaction.interaction_type,
+            "rating": interaction.rating,
+            "timestamp": now,
+        })
+        document_indexes.append(index)
+
+    failed = {}
+    if documents:
+        try:
+            interactions_collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed[error["index"]] = error.get("errmsg", "Write failed")
+
+    stored = []
+    for position, (index, document) in enumerate(zip(document_indexes, documents)):
+        if position in failed:
+            results[index] = {"index": index, "status": "error", "error": failed[position]}
+        else:
+            results[index] = {"index": index, "status": "inserted", "interaction_id": str(document["_id"])}
+            stored.append(document)
+
+    # Feed the incremental recommendation state and rollups in the same pass
+    on_interactions_stored(stored)
+
+    return {
+        "received": len(raw_items),
+        "inserted": len(stored),
+        "failed": len(raw_items) - len(stored),
+        "results": results,
+    }
+
+
+@app.post("/api/interactions/bulk")
+async def track_interactions_bulk(request: Request):
+    """
+    Track many interactions at once. Body is a JSON array of interactions or
+    NDJSON (one interaction per line, `Content-Type: application/x-ndjson`).
+    Returns a status per item, in request order.
+    """
+    try:
+        items = await _read_bulk_items(request)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if len(items) > MAX_BULK_INTERACTIONS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_BULK_INTERACTIONS} interactions per request"
+        )
+
+    # PyMongo is blocking: run the batch in a worker thread
+    return await asyncio.to_thread(_ingest_interactions, items)
+
+
+@app.get("/api/interactions/ingest/stats")
+def get_ingest_stats():
+    """Write-behind queue depth and flush latency"""
+    return interaction_queue.stats()
 
 
 # Get user interactions
@@ -400,8 +814,7 @@ def get_user_interactions(user_id: str):
 # Get product categories
 @app.get("/api/categories")
 def get_categories():
-    categories = products_collection.distinct("category")
-    return {"categories": categories}
+    return {"categories": catalog.categories()}
 
 
 # ==================== SHOPPING CART ====================
@@ -409,9 +822,14 @@ def get_categories():
 
 @app.get("/api/cart/{user_id}")
 def get_cart(user_id: str):
-    """Получить корзину пользователя"""
+    """
+    Получить корзину пользователя
+
+    Products come from the catalog snapshot (no round-trips); IDs it does not
+    know yet are resolved with one `$in` query through the product cache.
+    """
     try:
-        cart = carts_collection.find_one({"user_id": user_id})
+        cart = carts_collection.find_one({"user_id": user_id}, {"_id": 0, "items": 1})
 
         if not cart:
             return {"user_id": user_id, "items": [], "total": 0}
@@ -420,14 +838,15 @@ def get_cart(user_id: str):
         enriched_items = []
         total = 0
 
-        for item in cart.get("items", []):
+        items = cart.get("items", [])
+        products = product_cache.get_many(item["product_id"] for item in items)
+
+        for item in items:
             try:
-                product = products_collection.find_one(
-                    {"_id": ObjectId(item["product_id"])}
-                )
+                product = products.get(item["product_id"])
                 if product:
                     product_data = {
-                        "_id": str(product["_id"]),
+                        "_id": product["_id"],
                         "name": product["name"],
                         "price": product["price"],
                         "image_url": product.get("image_url", ""),
@@ -578,50 +997,63 @@ def clear_cart(user_id: str):
 
 @app.post("/api/checkout/{user_id}")
 def checkout(user_id: str, checkout_data: CheckoutRequest):
-    """Оформить заказ из корзины"""
+    """
+    Оформить заказ из корзины
+
+    One `$in` read for prices and names, then `inventory.place_order`:
+    conditional `$inc` decrements in a single bulk_write (transaction on a
+    replica set, two-phase reservation otherwise).
+    """
     try:
         # Получить корзину
-        cart = carts_collection.find_one({"user_id": user_id})
+        cart = carts_collection.find_one({"user_id": user_id}, {"items": 1})
         if not cart or not cart.get("items"):
             raise HTTPException(status_code=400, detail="Cart is empty")
 
-        # Проверить наличие и обновить stock
+        quantities = {}
+        for item in cart["items"]:
+            quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+
+        try:
+            object_ids = [ObjectId(product_id) for product_id in quantities]
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid product ID in cart")
+
+        products = {
+            str(p["_id"]): p
+            for p in products_collection.find(
+                {"_id": {"$in": object_ids}}, {"name": 1, "price": 1, "stock_quantity": 1, "category": 1}
+            )
+        }
+
+        # Проверить наличие (быстрый отказ; окончательная проверка атомарна)
         order_items = []
         total = 0
 
-        for item in cart["items"]:
-            product = products_collection.find_one(
-                {"_id": ObjectId(item["product_id"])}
-            )
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
             if not product:
                 raise HTTPException(
-                    status_code=404, detail=f"Product {item['product_id']} not found"
+                    status_code=404, detail=f"Product {product_id} not found"
                 )
 
             stock = product.get("stock_quantity", 0)
-            if stock < item["quantity"]:
+            if stock < quantity:
                 raise HTTPException(
                     status_code=400,
                     detail=f"Not enough stock for {product['name']}. Available: {stock}",
                 )
 
-            # Уменьшить stock
-            new_stock = stock - item["quantity"]
-            products_collection.update_one(
-                {"_id": ObjectId(item["product_id"])},
-                {"$set": {"stock_quantity": new_stock}},
-            )
-
             # Добавить в заказ
-            subtotal = product["price"] * item["quantity"]
+            subtotal = product["price"] * quantity
             total += subtotal
 
             order_items.append(
                 {
-                    "product_id": item["product_id"],
+                    "product_id": product_id,
                     "product_name": product["name"],
                     "price": product["price"],
-                    "quantity": item["quantity"],
+                    "quantity": quantity,
                     "subtotal": subtotal,
                 }
             )
@@ -637,17 +1069,29 @@ def checkout(user_id: str, checkout_data: CheckoutRequest):
             "created_at": datetime.utcnow(),
         }
 
-        result = orders_collection.insert_one(order)
-
-        # Очистить корзину
-        carts_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"items": [], "updated_at": datetime.utcnow()}},
-        )
+        # Списать stock, создать заказ и очистить корзину
+        try:
+            order_id = place_order(order, quantities)
+        except OutOfStock as e:
+            name = products[e.product_ids[0]]["name"] if e.product_ids[0] in products else e.product_ids[0]
+            raise HTTPException(status_code=400, detail=f"Not enough stock for {name}")
+
+        # Stock changed: serve the new quantities from this process right away
+        for product_id in quantities:
+            catalog.refresh_product(product_id)
+            product_cache.invalidate(product_id)
+
+        # Hourly/daily sales buckets; the order stands even if this fails
+        try:
+            analytics_rollups.record_order(
+                order, {product_id: p.get("category") for product_id, p in products.items()}
+            )
+        except PyMongoError as e:
+            print(f"ERROR updating sales rollups: {e}")
 
         return {
             "message": "Order placed successfully",
-            "order_id": str(result.inserted_id),
+            "order_id": str(order_id),
             "total": order["total"],
         }
 
@@ -723,11 +1167,12 @@ def forgot_password(request: ForgotPasswordRequest):
 
 
 @app.post("/api/reset-password")
-def reset_password(request: ResetPasswordRequest):
+async def reset_password(request: ResetPasswordRequest):
     """Сбросить пароль с токеном"""
+    adb = get_async_db()
     try:
         # Найти токен
-        token_doc = password_reset_tokens.find_one(
+        token_doc = await adb.password_reset_tokens.find_one(
             {"token": request.token, "used": False}
         )
 
@@ -739,14 +1184,14 @@ def reset_password(request: ResetPasswordRequest):
             raise HTTPException(status_code=400, detail="Token has expired")
 
         # Обновить пароль
-        new_hash = hash_password(request.new_password)
-        users_collection.update_one(
+        new_hash = await hash_password(request.new_password)
+        await adb.users.update_one(
             {"_id": ObjectId(token_doc["user_id"])},
             {"$set": {"password_hash": new_hash}},
         )
 
         # Отметить токен как использованный
-        password_reset_tokens.update_one(
+        await adb.password_reset_tokens.update_one(
             {"_id": token_doc["_id"]}, {"$set": {"used": True}}
         )
 
@@ -770,40 +1215,37 @@ def get_admin_stats(admin_user_id: str):
         if not admin or not admin.get("is_admin", False):
             raise HTTPException(status_code=403, detail="Admin access required")
 
-        total_users = users_collection.count_documents({})
-        total_products = products_collection.count_documents({})
-        total_orders = orders_collection.count_documents({})
-        total_revenue = 0
+        # One cached document shared by all admins (see admin_stats.py)
+        return admin_stats_cache.get()
 
-        # Подсчитать выручку
-        orders = orders_collection.find({"status": {"$ne": "cancelled"}})
-        for order in orders:
-            total_revenue += order.get("total", 0)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Популярные категории
-        pipeline = [
-            {"$group": {"_id": "$category", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 5},
-        ]
-        popular_categories = list(products_collection.aggregate(pipeline))
 
-        # Продукты с низким stock
-        low_stock_products = list(
-            products_collection.find({"stock_quantity": {"$lt": 10}}).limit(10)
-        )
+@app.get("/api/admin/analytics/sales")
+def get_sales_analytics(
+    admin_user_id: str,
+    granularity: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """
+    Orders, items, revenue and revenue per category for each hour/day bucket
+    in [start, end), read from the sales rollups (one document per bucket)
+    """
+    try:
+        admin = users_collection.find_one({"_id": ObjectId(admin_user_id)})
+        if not admin or not admin.get("is_admin", False):
+            raise HTTPException(status_code=403, detail="Admin access required")
 
-        for product in low_stock_products:
-            product["_id"] = str(product["_id"])
+        try:
+            series = analytics_rollups.sales_series(granularity, start, end)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        return {
-            "total_users": total_users,
-            "total_products": total_products,
-            "total_orders": total_orders,
-            "total_revenue": round(total_revenue, 2),
-            "popular_categories": popular_categories,
-            "low_stock_products": low_stock_products,
-        }
+        return {"granularity": granularity, "series": series}
 
     except HTTPException:
         raise
@@ -811,20 +1253,94 @@ def get_admin_stats(admin_user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/admin/analytics/interactions")
+def get_interaction_analytics(
+    admin_user_id: str,
+    granularity: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    product_id: Optional[str] = None,
+):
+    """Views, likes and ratings per hour/day bucket, for one product or all of them"""
+    try:
+        admin = users_collection.find_one({"_id": ObjectId(admin_user_id)})
+        if not admin or not admin.get("is_admin", False):
+            raise HTTPException(status_code=403, detail="Admin access required")
+
+        try:
+            series = analytics_rollups.interaction_series(
+                granularity, start, end, product_id or analytics_rollups.ALL_PRODUCTS
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        return {"granularity": granularity, "product_id": product_id, "series": series}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _created_at_query(start: Optional[datetime], end: Optional[datetime]) -> dict:
+    """created_at range filter [start, end) for the orders endpoints"""
+    created_at = {}
+    if start:
+        created_at["$gte"] = start
+    if end:
+        created_at["$lt"] = end
+    return {"created_at": created_at} if created_at else {}
+
+
 @app.get("/api/admin/orders")
-def get_all_orders(admin_user_id: str):
-    """Получить все заказы (только для админа)"""
+def get_all_orders(
+    admin_user_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """
+    Получить все заказы (только для админа), newest first
+
+    - `before`: `next_cursor` of the previous page
+    - `start` / `end`: created_at range
+    """
     try:
         admin = users_collection.find_one({"_id": ObjectId(admin_user_id)})
         if not admin or not admin.get("is_admin", False):
             raise HTTPException(status_code=403, detail="Admin access required")
 
-        orders = list(orders_collection.find().sort("created_at", -1).limit(50))
+        query = _created_at_query(start, end)
+        if before:
+            cursor_values = decode_cursor(before)
+            try:
+                created_at = datetime.fromisoformat(cursor_values["ts"])
+                last_id = ObjectId(cursor_values["id"])
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": last_id}},
+            ]
+
+        # One page on the (created_at, _id) index
+        orders = list(
+            orders_collection.find(query)
+            .sort([("created_at", -1), ("_id", -1)])
+            .limit(limit + 1)
+        )
+
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            last = orders[-1]
+            next_cursor = encode_cursor({"ts": last["created_at"].isoformat(), "id": str(last["_id"])})
 
         for order in orders:
             order["_id"] = str(order["_id"])
 
-        return {"orders": orders, "count": len(orders)}
+        return {"orders": orders, "count": len(orders), "next_cursor": next_cursor}
 
     except HTTPException:
         raise
@@ -832,6 +1348,89 @@ def get_all_orders(admin_user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+EXPORT_BATCH_SIZE = 500
+
+ORDER_CSV_COLUMNS = [
+    "order_id", "created_at", "user_id", "status", "payment_method", "shipping_address", "total",
+    "product_id", "product_name", "price", "quantity", "subtotal",
+]
+
+
+def _export_orders_ndjson(cursor):
+    for order in cursor:
+        order["_id"] = str(order["_id"])
+        yield json.dumps(jsonable_encoder(order)) + "\n"
+
+
+def _export_orders_csv(cursor):
+    """One row per order item; rows are written out one cursor batch at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ORDER_CSV_COLUMNS)
+
+    for count, order in enumerate(cursor, start=1):
+        created_at = order.get("created_at")
+        order_fields = [
+            str(order["_id"]),
+            created_at.isoformat() if created_at else "",
+            order.get("user_id", ""),
+            order.get("status", ""),
+            order.get("payment_method", ""),
+            order.get("shipping_address", ""),
+            order.get("total", ""),
+        ]
+        for item in order.get("items") or [{}]:
+            writer.writerow(order_fields + [
+                item.get("product_id", ""),
+                item.get("product_name", ""),
+                item.get("price", ""),
+                item.get("quantity", ""),
+                item.get("subtotal", ""),
+            ])
+
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+@app.get("/api/admin/orders/export")
+def export_orders(
+    admin_user_id: str,
+    format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """
+    Stream every order in [start, end) (oldest first) as NDJSON or CSV.
+
+    Orders are read with a batched cursor on the (created_at, _id) index and
+    written out as they arrive, so memory use does not grow with the export.
+    """
+    try:
+        admin = users_collection.find_one({"_id": ObjectId(admin_user_id)})
+        if not admin or not admin.get("is_admin", False):
+            raise HTTPException(status_code=403, detail="Admin access required")
+
+        cursor = (
+            orders_collection.find(_created_at_query(start, end))
+            .sort([("created_at", 1), ("_id", 1)])
+            .batch_size(EXPORT_BATCH_SIZE)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    filename = f"orders-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format == "csv":
+        return StreamingResponse(_export_orders_csv(cursor), media_type="text/csv", headers=headers)
+    return StreamingResponse(_export_orders_ndjson(cursor), media_type="application/x-ndjson", headers=headers)
+
+
 @app.put("/api/admin/products/{product_id}")
 def update_product(admin_user_id: str, product_id: str, update: ProductUpdate):
     """Обновить продукт (только для админа)"""
@@ -858,6 +1457,9 @@ def update_product(admin_user_id: str, product_id: str, update: ProductUpdate):
             products_collection.update_one(
                 {"_id": ObjectId(product_id)}, {"$set": update_fields}
             )
+            invalidate_product(product_id)
+            product_search_index.invalidate()
+            admin_stats_cache.invalidate()
 
         return {"message": "Product updated successfully"}
 
@@ -876,6 +1478,9 @@ def delete_product(admin_user_id: str, product_id: str):
             raise HTTPException(status_code=403, detail="Admin access required")
 
         products_collection.delete_one({"_id": ObjectId(product_id)})
+        invalidate_product(product_id)
+        product_search_index.invalidate()
+        admin_stats_cache.invalidate()
 
         return {"message": "Product deleted successfully"}
 
@@ -891,38 +1496,36 @@ def delete_product(admin_user_id: str, product_id: str):
 
 
 # Database indexes for performance
-def create_indexes():
-    """Create database indexes for better query performance"""
-    try:
-        print("[OPTIMIZATION] Creating database indexes...")
-        users_collection.create_index([("email", 1)], unique=True)
-        users_collection.create_index([("username", 1)])
-        products_collection.create_index([("category", 1)])
-        products_collection.create_index([("name", "text")])
-        interactions_collection.create_index([("user_id", 1)])
-        interactions_collection.create_index([("product_id", 1)])
-        interactions_collection.create_index([("user_id", 1), ("timestamp", -1)])
-        interactions_collection.create_index([("interaction_type", 1)])
-        carts_collection.create_index([("user_id", 1)])
-        orders_collection.create_index([("user_id", 1)])
-        orders_collection.create_index([("created_at", -1)])
-        print("[OPTIMIZATION] Database indexes created successfully")
-    except Exception as e:
-        print(f"[OPTIMIZATION] Warning: Some indexes may already exist: {e}")
-
-
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database indexes on startup"""
+def startup():
+    """Connect to MongoDB, initialize indexes and start background workers"""
     print("\n" + "="*60)
     print("[OPTIMIZATION] FASTAPI SERVER STARTING WITH OPTIMIZATIONS")
     print("="*60)
-    create_indexes()
+    database.connect()
+    # Index builds run in the background; /api/health/ready reports progress
+    index_migrator.start()
+    # Roll back or finish checkouts interrupted by a crash, now and periodically
+    start_recovery()
+    catalog.start()
+    if WRITE_BEHIND_ENABLED:
+        interaction_queue.start()
+    password_hasher.start()
     print("="*60)
     print("[OPTIMIZATION] Server is ready with optimized performance!")
     print("="*60 + "\n")
 
 
+def shutdown():
+    # Drain queued interactions before the connections go away
+    interaction_queue.stop()
+    catalog.stop()
+    index_migrator.stop()
+    stop_recovery()
+    password_hasher.shutdown()
+    close_async_client()
+    database.close()
+
+
 from recommendation_routes import router
 
 app.include_router(router)
@@ -0,0 +1,49 @@
+"""
+Helpers for keyset (cursor) pagination and field projection.
+
+Cursors are opaque URL-safe strings wrapping the sort key of the last item
+on a page; the next page starts strictly after it, so deep pages cost the
+same as the first one (no skip/offset).
+"""
+
+import base64
+import json
+from typing import Dict, Iterable, Optional
+
+from fastapi import HTTPException
+
+
+def encode_cursor(values: Dict) -> str:
+    payload = json.dumps(values, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict:
+    """Decode a cursor from `encode_cursor`; 400 if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, dict):
+            raise ValueError("cursor must encode an object")
+        return values
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[Dict[str, int]]:
+    """
+    Turn `fields=name,price` into a MongoDB projection. `_id` is always
+    returned. None means "all fields".
+    """
+    if not fields:
+        return None
+
+    allowed = set(allowed)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+
+    return {field: 1 for field in requested}
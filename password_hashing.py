@@ -0,0 +1,148 @@
+"""
+bcrypt hashing and verification in a dedicated process pool.
+
+bcrypt at cost 10 takes ~50-100ms of CPU per call. Run inside sync handlers
+it occupies one of the threadpool workers that every other sync endpoint
+shares, so a burst of logins starves browsing. Here the work runs in a small
+process pool, and async endpoints await it without holding a thread.
+
+At most PASSWORD_HASH_CONCURRENCY operations are in flight; further callers
+wait up to PASSWORD_HASH_QUEUE_TIMEOUT seconds for a slot and then get
+`PasswordHasherBusy` (HTTP 503), so a login storm degrades logins only.
+
+This module is imported by the spawned workers: keep its imports light.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+import bcrypt
+
+BCRYPT_ROUNDS = 10
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_CONCURRENCY = int(
+    os.getenv("PASSWORD_HASH_CONCURRENCY", str(PASSWORD_HASH_WORKERS * 2))
+)
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))
+
+
+def hash_password(password: str) -> str:
+    # Using 10 rounds for better performance while maintaining security
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+class PasswordHasherBusy(Exception):
+    """No hashing slot became free within the queue timeout"""
+
+
+class PasswordHasher:
+    """Bounded async front-end to a bcrypt process pool, with queue-time metrics"""
+
+    def __init__(self, workers: int, max_concurrency: int, queue_timeout: float):
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
+
+        # Metrics
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_ms = 0.0
+        self._total_queue_ms = 0.0
+        self._total_run_ms = 0.0
+
+    def start(self):
+        """Create the pool and spawn its workers up front (first logins stay fast)"""
+        if self._executor is None:
+            # spawn: workers must not inherit the server's sockets and threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            for _ in range(self.workers):
+                self._executor.submit(os.getpid)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(verify_password, password, hashed)
+
+    def _slots(self) -> asyncio.Semaphore:
+        """Concurrency limit; asyncio primitives belong to one event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _run(self, fn, *args):
+        slots = self._slots()
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        queue_ms = (started_at - queued_at) * 1000
+        self._total_queue_ms += queue_ms
+        self.max_queue_ms = max(self.max_queue_ms, queue_ms)
+        self.in_flight += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.start(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died: drop the pool so the next call builds a new one
+            self._executor = None
+            raise
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._total_run_ms += (time.perf_counter() - started_at) * 1000
+            slots.release()
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "queue_timeout_seconds": self.queue_timeout,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_queue_ms": round(self._total_queue_ms / self.completed, 2) if self.completed else 0.0,
+            "max_queue_ms": round(self.max_queue_ms, 2),
+            "avg_hash_ms": round(self._total_run_ms / self.completed, 2) if self.completed else 0.0,
+        }
+
+
+# Process-wide instance used by the auth endpoints
+password_hasher = PasswordHasher(
+    PASSWORD_HASH_WORKERS, PASSWORD_HASH_CONCURRENCY, PASSWORD_HASH_QUEUE_TIMEOUT
+)
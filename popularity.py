@@ -0,0 +1,230 @@
+"""
+Materialized popularity leaderboard.
+
+Replaces the per-request `$group` over the whole interactions collection.
+Scores are the same recency-decayed interaction scores used everywhere else
+(`score_interactions`), summed per product and kept as a list sorted
+by score, so reading the top N is a slice.
+
+- New interactions are folded in incrementally (`add_interaction`)
+- A rollup rescans interactions every `refresh_seconds` in a background thread,
+  re-applying recency decay as interactions age
+- Each rollup is persisted to the `product_popularity` collection
+- Interactions added while a rollup is scanning are replayed onto its result
+  unless the scan already counted them
+"""
+
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Interactions get their _id when received and are stored well within this
+# window, so a rollup only needs to remember the _ids of newer ones it counted
+_RECENT_SECONDS = 300
+
+
+class PopularityLeaderboard:
+    """Per-product popularity scores kept sorted in memory"""
+
+    def __init__(
+        self,
+        interactions_collection,
+        popularity_collection,
+        score_fn: Callable[[List[str], List[Optional[float]]], np.ndarray],
+        refresh_seconds: float = 300.0,
+    ):
+        self._interactions = interactions_collection
+        self._popularity = popularity_collection
+        self._score_fn = score_fn
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._scores: Dict[str, float] = {}
+        # Sorted ascending by (-score, product_id) => highest score first
+        self._ranking: List[Tuple[float, str]] = []
+        self._built_at: Optional[float] = None
+        self._refreshing = False
+        # (interaction _id, product_id, score) added while a rollup is scanning
+        self._missed: Optional[List[Tuple[object, str, float]]] = None
+
+    # ==================== ROLLUP ====================
+
+    def rebuild(self, persist: bool = True):
+        """Recompute all scores from interactions and (by default) persist them"""
+        start = time.time()
+        recent = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=_RECENT_SECONDS))
+        with self._lock:
+            self._missed = []
+        try:
+            scores, counted = self._scan(recent)
+        except Exception:
+            with self._lock:
+                self._missed = None
+            raise
+
+        with self._lock:
+            missed, self._missed = self._missed, None
+            for interaction_id, product_id, score in missed:
+                # Stored before the scan reached it: already counted
+                if interaction_id not in counted:
+                    scores[product_id] = scores.get(product_id, 0.0) + score
+
+            ranking = sorted((-score, product_id) for product_id, score in scores.items())
+            self._scores = scores
+            self._ranking = ranking
+            self._built_at = time.time()
+
+        if persist:
+            self._persist(ranking)
+
+        print(
+            f"[OPTIMIZATION] Popularity leaderboard rebuilt: {len(ranking)} products "
+            f"in {(time.time() - start) * 1000:.1f}ms"
+        )
+
+    def _scan(self, recent: ObjectId):
+        """Scores per product, and the _ids of counted interactions newer than `recent`"""
+        product_index: Dict[str, int] = {}
+        positions: List[int] = []
+        types: List[str] = []
+        timestamps: List = []
+
+        counted = set()
+        # Timestamps come back as epoch milliseconds, ready for vectorized scoring
+        cursor = self._interactions.aggregate([
+            {"$project": {
+                "_id": 1,
+                "product_id": 1,
+                "interaction_type": 1,
+                "timestamp_ms": {"$subtract": ["$timestamp", _EPOCH]},
+            }}
+        ])
+        for interaction in cursor:
+            product_id = interaction.get("product_id")
+            if product_id:
+                positions.append(product_index.setdefault(product_id, len(product_index)))
+                types.append(interaction.get("interaction_type", "view"))
+                timestamps.append(interaction.get("timestamp_ms"))
+                interaction_id = interaction["_id"]
+                if isinstance(interaction_id, ObjectId) and interaction_id >= recent:
+                    counted.add(interaction_id)
+
+        # One vectorized scoring pass, summed per product
+        totals = np.bincount(
+            np.asarray(positions, dtype=np.int64),
+            weights=self._score_fn(types, timestamps),
+            minlength=len(product_index),
+        )
+        scores = {product_id: float(totals[j]) for product_id, j in product_index.items()}
+        return scores, counted
+
+    def _persist(self, ranking: List[Tuple[float, str]]):
+        now = datetime.utcnow()
+        operations = [
+            ReplaceOne(
+                {"_id": product_id},
+                {"_id": product_id, "score": -neg_score, "rank": rank, "updated_at": now},
+                upsert=True,
+            )
+            for rank, (neg_score, product_id) in enumerate(ranking, start=1)
+        ]
+
+        try:
+            if operations:
+                self._popularity.bulk_write(operations, ordered=False)
+            self._popularity.delete_many({"updated_at": {"$lt": now}})
+        except Exception as e:
+            print(f"[OPTIMIZATION] Warning: could not persist popularity leaderboard: {e}")
+
+    def _refresh_in_background(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            print(f"ERROR refreshing popularity leaderboard: {e}")
+        finally:
+            self._refreshing = False
+
+    def scores(self) -> Dict[str, float]:
+        """Current score per product"""
+        with self._lock:
+            return dict(self._scores)
+
+    def install(self, scores: Dict[str, float]):
+        """Serve scores computed elsewhere (e.g. by a parent process); never rebuilt here"""
+        ranking = sorted((-score, product_id) for product_id, score in scores.items())
+        with self._lock:
+            self.refresh_seconds = float("inf")
+            self._scores = dict(scores)
+            self._ranking = ranking
+            self._built_at = time.time()
+
+    def is_built(self) -> bool:
+        """True once the first (synchronous) build has happened"""
+        return self._built_at is not None
+
+    def ensure_fresh(self):
+        """
+        Build synchronously on first use; afterwards serve the current ranking
+        and refresh it in a background thread once it is stale.
+        """
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self.rebuild()
+            return
+
+        if time.time() - self._built_at < self.refresh_seconds:
+            return
+
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    # ==================== INCREMENTAL UPDATES ====================
+
+    def add_interaction(self, interaction: Dict):
+        """Add one new interaction's score to its product"""
+        product_id = interaction.get("product_id")
+        if not product_id:
+            return
+
+        timestamp = interaction.get("timestamp")
+        timestamp_ms = (timestamp - _EPOCH) / timedelta(milliseconds=1) if timestamp else None
+        score = float(
+            self._score_fn([interaction.get("interaction_type", "view")], [timestamp_ms])[0]
+        )
+
+        with self._lock:
+            if self._missed is not None:
+                self._missed.append((interaction.get("_id"), product_id, score))
+            if self._built_at is None:
+                return
+
+            old_score = self._scores.get(product_id)
+            if old_score is not None:
+                idx = bisect.bisect_left(self._ranking, (-old_score, product_id))
+                if idx < len(self._ranking) and self._ranking[idx][1] == product_id:
+                    del self._ranking[idx]
+
+            new_score = (old_score or 0) + score
+            self._scores[product_id] = new_score
+            bisect.insort(self._ranking, (-new_score, product_id))
+
+    # ==================== QUERIES ====================
+
+    def top(self, n: int) -> List[Tuple[str, float]]:
+        """Top N (product_id, score) pairs, highest score first"""
+        self.ensure_fresh()
+        with self._lock:
+            return [(product_id, -neg_score) for neg_score, product_id in self._ranking[:n]]
@@ -0,0 +1,152 @@
+"""
+Offline recommendation precompute job.
+
+Computes top-N recommendations for every user with a process pool and
+bulk-writes them into the `recommendations_precomputed` serving collection,
+stamped with a generation. The user-item matrix, item neighbours and
+popularity scores are built once in the parent and handed to each worker, so
+workers neither rebuild them nor write the shared `item_similarity` /
+`product_popularity` collections. `/api/recommendations/{user_id}?source=precomputed`
+then serves them with a single `_id` lookup.
+
+Usage:
+    python precompute_recommendations.py
+    python precompute_recommendations.py --methods hybrid content --n 8 10 --workers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List
+
+from pymongo import ReplaceOne
+
+PRECOMPUTED_COLLECTION = "recommendations_precomputed"
+DEFAULT_METHODS = ["hybrid", "content", "collaborative"]
+
+
+def precomputed_key(user_id: str, method: str, n: int) -> str:
+    """_id of a precomputed recommendation document"""
+    return f"{user_id}:{method}:{n}"
+
+
+def _build_indexes() -> Dict:
+    """Build the in-memory recommendation indexes once, without persisting them"""
+    from recommendation_routes import item_similarity_index, popularity_leaderboard, user_item_matrix
+
+    item_similarity_index.build(persist=False)
+    popularity_leaderboard.rebuild(persist=False)
+    return {
+        "matrix": user_item_matrix.snapshot(),
+        "neighbours": item_similarity_index.neighbour_lists(),
+        "popularity": popularity_leaderboard.scores(),
+    }
+
+
+def _init_worker(indexes: Dict):
+    """Worker initializer: serve the parent's indexes instead of building them"""
+    from recommendation_routes import item_similarity_index, popularity_leaderboard, user_item_matrix
+
+    user_item_matrix.install(indexes["matrix"])
+    item_similarity_index.install(indexes["neighbours"])
+    popularity_leaderboard.install(indexes["popularity"])
+
+
+def _process_chunk(user_ids: List[str], methods: List[str], sizes: List[int], generation: int) -> int:
+    """Worker: compute and write recommendations for one chunk of users"""
+    # Imported here so each (spawned) worker builds its own client
+    from database import db
+    from recommendation_routes import RECOMMENDERS, build_user_profiles
+
+    # Interactions are loaded once per chunk and shared by every method and size
+    profiles = build_user_profiles(user_ids)
+
+    now = datetime.utcnow()
+    operations = []
+    for method in methods:
+        recommender = RECOMMENDERS[method]
+        for n in sizes:
+            for user_id in user_ids:
+                key = precomputed_key(user_id, method, n)
+                operations.append(
+                    ReplaceOne(
+                        {"_id": key},
+                        {
+                            "_id": key,
+                            "user_id": user_id,
+                            "method": method,
+                            "n": n,
+                            "recommendations": recommender(user_id, n, profiles[user_id]),
+                            "generation": generation,
+                            "computed_at": now,
+                        },
+                        upsert=True,
+                    )
+                )
+
+    if operations:
+        db[PRECOMPUTED_COLLECTION].bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def run(methods: List[str], sizes: List[int], workers: int, chunk_size: int) -> int:
+    from database import db
+
+    generation = int(time.time())
+    user_ids = [str(u["_id"]) for u in db.users.find({}, {"_id": 1})]
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+
+    print(
+        f"[PRECOMPUTE] Generation {generation}: {len(user_ids)} users, "
+        f"methods={methods}, n={sizes}, {len(chunks)} chunks on {workers} workers"
+    )
+
+    start = time.time()
+    indexes = _build_indexes()
+    written = 0
+    # spawn: workers must not inherit the parent's MongoClient
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(indexes,)
+    ) as pool:
+        futures = [
+            pool.submit(_process_chunk, chunk, methods, sizes, generation) for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            written += future.result()
+
+    # Drop documents from previous generations only after a complete run, and
+    # only for the methods and sizes this run recomputed
+    removed = db[PRECOMPUTED_COLLECTION].delete_many(
+        {"method": {"$in": methods}, "n": {"$in": sizes}, "generation": {"$ne": generation}}
+    )
+
+    print(
+        f"[PRECOMPUTE] Wrote {written} documents in {time.time() - start:.1f}s, "
+        f"removed {removed.deleted_count} stale"
+    )
+    return generation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute top-N recommendations per user")
+    parser.add_argument(
+        "--methods", nargs="+", default=DEFAULT_METHODS,
+        choices=["hybrid", "content", "collaborative", "item"],
+    )
+    parser.add_argument(
+        "--n", nargs="+", type=int, default=[8, 10],
+        help="List sizes to precompute (served only for an exact n match)",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=200)
+    args = parser.parse_args()
+
+    run(args.methods, args.n, args.workers, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
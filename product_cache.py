@@ -0,0 +1,152 @@
+"""
+Shared product lookup layer.
+
+Resolves a whole set of product IDs with a single `$in` query and keeps hot
+products in an in-process LRU cache with a TTL. Used by every recommendation
+path instead of one `find_one` per product.
+
+Writers must call `product_cache.invalidate(product_id)` after updating or
+deleting a product.
+
+`get_many_async` is the same lookup for async endpoints, fetching misses
+through Motor.
+
+Once the catalog snapshot is loaded, products are served from it and only
+IDs it does not know about go through the LRU / MongoDB path.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from bson import ObjectId
+
+from async_database import get_async_db
+from catalog import catalog
+from database import products_collection
+
+
+class ProductCache:
+    """LRU + TTL cache of product documents keyed by string ID"""
+
+    def __init__(self, collection, ttl_seconds: float = 300.0, max_size: int = 5000, snapshot=None):
+        self._collection = collection
+        self._snapshot = snapshot
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so in-flight fetches don't re-cache stale docs
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, product_id: str) -> Optional[Dict]:
+        """Get a single product (copy) or None"""
+        return self.get_many([product_id]).get(product_id)
+
+    def get_many(self, product_ids: Iterable[str]) -> Dict[str, Dict]:
+        """
+        Get products by ID. Cached products are served from memory, the rest
+        are fetched with one `$in` query. Unknown or invalid IDs are omitted.
+
+        Returned documents are copies with `_id` as a string, so callers may
+        mutate them freely. Results follow the order of `product_ids`.
+        """
+        requested, found, object_ids, generation = self._lookup(product_ids)
+
+        if object_ids:
+            fetched = self._store(
+                self._collection.find({"_id": {"$in": object_ids}}), generation
+            )
+            found.update(fetched)
+
+        return self._result(requested, found)
+
+    async def get_many_async(self, product_ids: Iterable[str]) -> Dict[str, Dict]:
+        """get_many for async endpoints (misses fetched through Motor)"""
+        requested, found, object_ids, generation = self._lookup(product_ids)
+
+        if object_ids:
+            cursor = get_async_db().products.find({"_id": {"$in": object_ids}})
+            fetched = self._store(await cursor.to_list(length=None), generation)
+            found.update(fetched)
+
+        return self._result(requested, found)
+
+    def _lookup(self, product_ids: Iterable[str]):
+        """Split requested IDs into cached products and ObjectIds to fetch"""
+        now = time.time()
+        requested = list(dict.fromkeys(product_ids))
+        found: Dict[str, Dict] = {}
+        missing = []
+
+        if self._snapshot is not None and self._snapshot.is_loaded():
+            found.update(self._snapshot.lookup(requested))
+
+        with self._lock:
+            generation = self._generation
+            for product_id in requested:
+                if product_id in found:
+                    self.hits += 1
+                    continue
+                entry = self._entries.get(product_id)
+                if entry is not None and now - entry[0] < self.ttl_seconds:
+                    self._entries.move_to_end(product_id)
+                    found[product_id] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(product_id)
+                    self.misses += 1
+
+        object_ids = []
+        for product_id in missing:
+            try:
+                object_ids.append(ObjectId(product_id))
+            except Exception:
+                continue
+
+        return requested, found, object_ids, generation
+
+    def _store(self, products, generation: int) -> Dict[str, Dict]:
+        """Cache freshly fetched products (unless invalidated meanwhile)"""
+        now = time.time()
+        fetched = {}
+        for product in products:
+            product["_id"] = str(product["_id"])
+            fetched[product["_id"]] = product
+
+        with self._lock:
+            if generation == self._generation:
+                for product_id, product in fetched.items():
+                    self._entries[product_id] = (now, product)
+                    self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return fetched
+
+    @staticmethod
+    def _result(requested, found) -> Dict[str, Dict]:
+        return {
+            product_id: dict(found[product_id])
+            for product_id in requested
+            if product_id in found
+        }
+
+    def invalidate(self, product_id: str):
+        """Drop a product so the next read goes to MongoDB"""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(product_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+# Process-wide instance shared by all modules
+product_cache = ProductCache(products_collection, snapshot=catalog)
+catalog.subscribe(product_cache.invalidate)
@@ -0,0 +1,136 @@
+"""
+Per-user recommendation result cache.
+
+Results are keyed by (user_id, method, n) and held for `ttl_seconds` in an LRU
+bounded to `max_size` entries. Invalidation is targeted:
+- a new interaction drops only that user's entries
+- a product change drops only entries that contain the product
+"""
+
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+CacheKey = Tuple[str, str, int]
+
+
+class RecommendationCache:
+    """TTL + LRU cache of recommendation lists with hit/miss counters"""
+
+    def __init__(self, ttl_seconds: float = 60.0, max_size: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[CacheKey, tuple]" = OrderedDict()
+        self._keys_by_user: Dict[str, set] = defaultdict(set)
+        self._keys_by_product: Dict[str, set] = defaultdict(set)
+        # Bumped on invalidation so results computed before it are not stored
+        self._user_versions: Dict[str, int] = defaultdict(int)
+        self._version = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str, method: str, n: int) -> Optional[List[Dict]]:
+        key = (user_id, method, n)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] >= self.ttl_seconds:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [dict(product) for product in entry[1]]
+
+    def version(self, user_id: str) -> Tuple[int, int]:
+        """Token to pass to `put`; take it before computing the result"""
+        with self._lock:
+            return (self._version, self._user_versions.get(user_id, 0))
+
+    def put(
+        self,
+        user_id: str,
+        method: str,
+        n: int,
+        recommendations: List[Dict],
+        version: Optional[Tuple[int, int]] = None,
+    ):
+        key = (user_id, method, n)
+        stored = [dict(product) for product in recommendations]
+
+        with self._lock:
+            current = (self._version, self._user_versions.get(user_id, 0))
+            if version is not None and version != current:
+                return
+
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.time(), stored)
+            self._keys_by_user[user_id].add(key)
+            for product in stored:
+                self._keys_by_product[str(product.get("_id"))].add(key)
+
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def invalidate_user(self, user_id: str):
+        """Drop every cached result for a user"""
+        with self._lock:
+            self._user_versions[user_id] += 1
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_product(self, product_id: str):
+        """Drop every cached result that contains a product"""
+        with self._lock:
+            self._version += 1
+            for key in list(self._keys_by_product.get(product_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self._keys_by_product.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: CacheKey):
+        """Remove an entry and its index references (lock must be held)"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        user_keys = self._keys_by_user.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[key[0]]
+
+        for product in entry[1]:
+            product_id = str(product.get("_id"))
+            product_keys = self._keys_by_product.get(product_id)
+            if product_keys is not None:
+                product_keys.discard(key)
+                if not product_keys:
+                    del self._keys_by_product[product_id]
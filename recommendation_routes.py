@@ -9,16 +9,31 @@ Key Strategy: MMR (Maximal Marginal Relevance) for diversity
 """
 
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from pymongo import MongoClient
 from bson import ObjectId
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple
 from collections import Counter, defaultdict
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+import json
 import math
+import numpy as np
 
 # Import shared MongoDB connection from database module
 # This ensures we use the same connection pool across the entire app
+from async_database import get_async_db
+from catalog import catalog
 from database import db, client
+from item_similarity import ItemSimilarityIndex
+from popularity import PopularityLeaderboard
+from precompute_recommendations import PRECOMPUTED_COLLECTION, precomputed_key
+from product_cache import product_cache
+from recommendation_cache import RecommendationCache
+from user_item_matrix import UserItemMatrix
 print("[OPTIMIZATION] recommendation_routes using shared MongoDB connection pool")
 
 router = APIRouter()
@@ -45,19 +60,39 @@ CONFIG = {
         "enabled": True,
         "lambda": 0.7,  # 0.7 = 70% relevance, 30% diversity
         "max_per_category": 3,  # Max 3 items from same category
+        "candidate_pool": 3,  # Diversify over the top n * candidate_pool items
     },
     # User similarity
     "similarity": {
         "min_threshold": 0.15,  # Minimum 15% overlap
         "top_k_users": 25,  # Consider top 25 similar users
     },
+    # Resident user-item matrix
+    "matrix": {
+        "refresh_seconds": 60,  # Rebuild the sparse matrix at most once a minute
+    },
+    # Item-item similarity index
+    "item_similarity": {
+        "top_k": 20,  # Neighbours kept per product
+        "refresh_seconds": 3600,  # Full rebuild hourly, incremental in between
+        "persist_seconds": 30,  # Flush changed neighbour lists to MongoDB
+    },
+    # Materialized popularity leaderboard
+    "popularity": {
+        "refresh_seconds": 300,  # Background rollup re-applies recency decay
+    },
+    # Per-user result cache
+    "cache": {
+        "ttl_seconds": 60,  # Serve repeated requests for up to a minute
+        "max_size": 10000,  # LRU bound on (user_id, method, n) entries
+    },
 }
 
 
 # ==================== HELPER FUNCTIONS ====================
 
 
-def calculate_interaction_score(interaction: Dict) -> float:
+def calculate_interaction_score(interaction: Dict, now: Optional[datetime] = None) -> float:
     """Calculate weighted score for an interaction"""
 
     interaction_type = interaction.get("interaction_type", "view")
@@ -68,7 +103,7 @@ def calculate_interaction_score(interaction: Dict) -> float:
     recency_multiplier = 1.0
 
     if timestamp:
-        age_days = (datetime.utcnow() - timestamp).days
+        age_days = ((now or datetime.utcnow()) - timestamp).days
 
         if age_days <= 7:
             recency_multiplier = CONFIG["recency"]["days_0_7"]
@@ -82,6 +117,126 @@ def calculate_interaction_score(interaction: Dict) -> float:
     return base_weight * recency_multiplier
 
 
+EPOCH = datetime(1970, 1, 1)
+_DAY_US = 86_400_000_000
+
+
+def to_epoch_ms(timestamp: Optional[datetime]) -> Optional[float]:
+    """Naive UTC datetime -> milliseconds since epoch (None stays None)"""
+    if not timestamp:
+        return None
+    return (timestamp - EPOCH) / timedelta(milliseconds=1)
+
+
+def score_interactions(
+    interaction_types: List[str],
+    timestamps_ms: List[Optional[float]],
+    now: Optional[datetime] = None,
+) -> np.ndarray:
+    """
+    Vectorized calculate_interaction_score: weight x recency for many
+    interactions in one NumPy pass, using a single "now" for all of them.
+
+    Timestamps are milliseconds since epoch (None for missing), which is what
+    `{"$subtract": ["$timestamp", EPOCH]}` returns from MongoDB.
+    """
+
+    count = len(interaction_types)
+    if count == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    weights = CONFIG["weights"]
+    base_weights = np.fromiter(
+        (weights.get(t, 1.0) for t in interaction_types), dtype=np.float64, count=count
+    )
+
+    # Whole-day age, floored like timedelta.days (exact integer microseconds)
+    ts_us = np.rint(np.array(timestamps_ms, dtype=np.float64) * 1000)
+    now_us = (now or datetime.utcnow()) - EPOCH
+    now_us = (now_us.days * 86_400 + now_us.seconds) * 1_000_000 + now_us.microseconds
+    has_timestamp = ~np.isnan(ts_us)
+    age_days = np.floor_divide(now_us - np.where(has_timestamp, ts_us, now_us), _DAY_US)
+
+    recency = CONFIG["recency"]
+    multipliers = np.select(
+        [age_days <= 7, age_days <= 30, age_days <= 90],
+        [recency["days_0_7"], recency["days_8_30"], recency["days_31_90"]],
+        default=recency["days_90_plus"],
+    )
+    multipliers = np.where(has_timestamp, multipliers, 1.0)
+
+    return base_weights * multipliers
+
+
+def score_interaction_docs(interactions: List[Dict], now: Optional[datetime] = None) -> np.ndarray:
+    """score_interactions over a list of interaction documents"""
+    return score_interactions(
+        [i.get("interaction_type", "view") for i in interactions],
+        [to_epoch_ms(i.get("timestamp")) for i in interactions],
+        now,
+    )
+
+
+# Resident sparse user x item matrix backing collaborative filtering
+user_item_matrix = UserItemMatrix(
+    db.interactions,
+    score_interactions,
+    refresh_seconds=CONFIG["matrix"]["refresh_seconds"],
+)
+
+# Precomputed top-K item neighbours backing method=item
+item_similarity_index = ItemSimilarityIndex(
+    db.interactions,
+    db.item_similarity,
+    top_k=CONFIG["item_similarity"]["top_k"],
+    refresh_seconds=CONFIG["item_similarity"]["refresh_seconds"],
+    persist_seconds=CONFIG["item_similarity"]["persist_seconds"],
+)
+
+
+# Recency-decayed popularity, kept sorted for popular/cold-start paths
+popularity_leaderboard = PopularityLeaderboard(
+    db.interactions,
+    db.product_popularity,
+    score_interactions,
+    refresh_seconds=CONFIG["popularity"]["refresh_seconds"],
+)
+
+
+# Finished recommendation lists per (user_id, method, n)
+recommendation_cache = RecommendationCache(
+    ttl_seconds=CONFIG["cache"]["ttl_seconds"],
+    max_size=CONFIG["cache"]["max_size"],
+)
+# Products changed by other workers (change stream / catalog reload)
+catalog.subscribe(recommendation_cache.invalidate_product)
+
+
+def record_interaction(interaction: Dict):
+    """Feed a newly stored interaction into the incremental recommendation state"""
+    try:
+        recommendation_cache.invalidate_user(interaction.get("user_id"))
+        item_similarity_index.add_interaction(
+            interaction.get("user_id"), interaction.get("product_id")
+        )
+        popularity_leaderboard.add_interaction(interaction)
+    except Exception as e:
+        print(f"ERROR updating recommendation state: {e}")
+
+
+def record_interactions(interactions: List[Dict]):
+    """record_interaction for a batch of stored interactions"""
+    for interaction in interactions:
+        record_interaction(interaction)
+
+
+def invalidate_product(product_id: str):
+    """Drop cached data for a product after it was updated or deleted"""
+    catalog.refresh_product(product_id)
+    product_cache.invalidate(product_id)
+    recommendation_cache.invalidate_product(product_id)
+
+
 def calculate_jaccard_similarity(set1: set, set2: set) -> float:
     """Jaccard similarity coefficient"""
     if not set1 or not set2:
@@ -105,6 +260,12 @@ def diversify_recommendations(
     - 1.0 = Only relevance (no diversity)
     - 0.5 = Equal balance
     - 0.0 = Only diversity (no relevance)
+
+    The diversity penalty only depends on the candidate's category, so within
+    a category the best candidate is always the most relevant one. Candidates
+    are bucketed into one heap per category and each step only compares the
+    heads of the non-capped categories: O(n log n + k * categories) instead of
+    rescanning every remaining candidate against every selected item.
     """
 
     if not CONFIG["diversity"]["enabled"]:
@@ -113,178 +274,404 @@ def diversify_recommendations(
     if len(candidates) <= max_results:
         return candidates
 
-    selected = []
-    remaining = candidates.copy()
-    category_counts = Counter()
     max_per_category = CONFIG["diversity"]["max_per_category"]
+    max_relevance = candidates[0].get("recommendation_score", 1)
 
     # First, add the highest scoring item
-    if remaining:
-        best = remaining.pop(0)
-        selected.append(best)
-        category_counts[best.get("category")] += 1
+    selected = [candidates[0]]
+    taken = [False] * len(candidates)
+    taken[0] = True
+    category_counts = Counter({candidates[0].get("category"): 1})
+
+    # Per-category heaps of (-λ * normalized relevance, position); position
+    # breaks ties the same way a left-to-right scan would
+    heaps = defaultdict(list)
+    for idx in range(1, len(candidates)):
+        candidate = candidates[idx]
+        relevance = candidate.get("recommendation_score", 0)
+        normalized_relevance = relevance / max_relevance if max_relevance > 0 else 0
+        heaps[candidate.get("category")].append((-(lambda_param * normalized_relevance), idx))
+    for heap in heaps.values():
+        heapq.heapify(heap)
+
+    # Lowest position not yet selected
+    first_remaining = 1
 
     # Iteratively select items that balance relevance and diversity
-    while len(selected) < max_results and remaining:
+    while len(selected) < max_results and first_remaining < len(candidates):
         best_score = -float("inf")
-        best_idx = 0
-
-        for idx, candidate in enumerate(remaining):
-            category = candidate.get("category")
+        best_idx = None
+        best_heap = None
 
+        for category, heap in heaps.items():
             # Hard limit on category repetition
             if category_counts[category] >= max_per_category:
                 continue
 
-            # Relevance score (normalized)
-            relevance = candidate.get("recommendation_score", 0)
-            max_relevance = candidates[0].get("recommendation_score", 1)
-            normalized_relevance = relevance / max_relevance if max_relevance > 0 else 0
+            # Drop entries already taken through the fallback below
+            while heap and taken[heap[0][1]]:
+                heapq.heappop(heap)
+            if not heap:
+                continue
 
-            # Diversity penalty (how similar to already selected items)
-            diversity_penalty = 0
-            for selected_item in selected:
-                if selected_item.get("category") == category:
-                    diversity_penalty += 0.5  # Same category penalty
+            neg_relevance, idx = heap[0]
 
-            # Normalize diversity penalty
+            # Same-category penalty of 0.5 per selected item, normalized
+            diversity_penalty = category_counts[category] * 0.5
             max_penalty = len(selected) * 0.5
             normalized_penalty = (
                 diversity_penalty / max_penalty if max_penalty > 0 else 0
             )
 
             # MMR score
-            mmr_score = (lambda_param * normalized_relevance) - (
-                (1 - lambda_param) * normalized_penalty
-            )
+            mmr_score = -neg_relevance - ((1 - lambda_param) * normalized_penalty)
 
-            if mmr_score > best_score:
+            if mmr_score > best_score or (mmr_score == best_score and idx < best_idx):
                 best_score = mmr_score
                 best_idx = idx
+                best_heap = heap
 
-        # Add best item
-        if remaining:
-            selected_item = remaining.pop(best_idx)
-            selected.append(selected_item)
-            category_counts[selected_item.get("category")] += 1
-
-    return selected
+        if best_heap is not None:
+            heapq.heappop(best_heap)
+        else:
+            # Every remaining category is capped: take the next item in order
+            best_idx = first_remaining
 
+        taken[best_idx] = True
+        selected_item = candidates[best_idx]
+        selected.append(selected_item)
+        category_counts[selected_item.get("category")] += 1
 
-# ==================== CONTENT-BASED (OPTIMIZED) ====================
+        while first_remaining < len(candidates) and taken[first_remaining]:
+            first_remaining += 1
 
+    return selected
 
-def get_content_based_recommendations_balanced(user_id: str, n: int = 10) -> List[Dict]:
-    """Optimized content-based with diversity"""
 
-    try:
-        # Get user interactions (with projection for less data transfer)
-        interactions = list(
-            db.interactions.find(
-                {"user_id": user_id}, {"product_id": 1, "interaction_type": 1, "timestamp": 1}
-            )
-        )
+# ==================== USER PROFILE ====================
 
-        if not interactions:
-            return get_popular_products(n)
 
-        # Get unique product IDs
-        product_ids = list(set(i["product_id"] for i in interactions))
+class UserProfile:
+    """
+    Everything the strategies need about a user's history, built from a single
+    interactions read so hybrid requests don't repeat it per strategy.
+    """
 
-        # Fetch all products at once instead of one by one
-        products_map = {}
-        products = db.products.find(
-            {"_id": {"$in": [ObjectId(pid) for pid in product_ids]}},
-            {"category": 1, "price": 1}
-        )
-        for product in products:
-            products_map[str(product["_id"])] = product
+    def __init__(self, user_id: str, interactions: List[Dict], products_map: Dict[str, Dict]):
+        self.user_id = user_id
+        self.interactions = interactions
+        self.interaction_count = len(interactions)
+        self.products_map = products_map
 
-        # Calculate weighted category preferences
-        category_scores = defaultdict(float)
+        # Weighted score per product the user interacted with
+        self.product_scores: Dict[str, float] = defaultdict(float)
+        # Weighted category preferences and prices of interacted products
+        self.category_scores: Dict[str, float] = defaultdict(float)
         price_list = []
-        interacted_product_ids = set()
 
-        for interaction in interactions:
+        scores = score_interaction_docs(interactions)
+
+        for interaction, score in zip(interactions, scores.tolist()):
             product_id = interaction["product_id"]
-            interacted_product_ids.add(product_id)
+            self.product_scores[product_id] += score
 
             product = products_map.get(product_id)
             if not product:
                 continue
 
-            category = product.get("category", "Unknown")
-            price = product.get("price", 0)
+            self.category_scores[product.get("category", "Unknown")] += score
+            price_list.append(product.get("price", 0))
+
+        self.product_ids = set(self.product_scores)
+        self.avg_price = sum(price_list) / len(price_list) if price_list else 0
+
 
-            score = calculate_interaction_score(interaction)
-            category_scores[category] += score
-            price_list.append(price)
+PROFILE_PROJECTION = {"product_id": 1, "interaction_type": 1, "timestamp": 1}
 
-        # Get top categories (top 60% by weight)
-        total_weight = sum(category_scores.values())
-        sorted_categories = sorted(
-            category_scores.items(), key=lambda x: x[1], reverse=True
+
+def build_user_profile(user_id: str) -> UserProfile:
+    """Load a user's interactions (one query) and the products they touched"""
+
+    # With projection for less data transfer
+    interactions = list(
+        db.interactions.find({"user_id": user_id}, PROFILE_PROJECTION)
+    )
+
+    # Fetch all products at once instead of one by one
+    product_ids = set(i["product_id"] for i in interactions)
+    products_map = product_cache.get_many(product_ids)
+
+    return UserProfile(user_id, interactions, products_map)
+
+
+def build_user_profiles(user_ids: List[str]) -> Dict[str, UserProfile]:
+    """Profiles for many users: one interactions query, one products lookup"""
+
+    interactions_by_user = defaultdict(list)
+    if user_ids:
+        cursor = db.interactions.find(
+            {"user_id": {"$in": user_ids}}, {**PROFILE_PROJECTION, "user_id": 1}
         )
+        for interaction in cursor:
+            interactions_by_user[interaction["user_id"]].append(interaction)
 
-        cumulative_weight = 0
-        favorite_cats = []
-        for cat, weight in sorted_categories:
-            favorite_cats.append(cat)
-            cumulative_weight += weight
-            if cumulative_weight >= total_weight * 0.6:  # Top 60% of weight
-                break
-
-        # Ensure at least 2 categories for diversity
-        if len(favorite_cats) < 2 and len(sorted_categories) >= 2:
-            favorite_cats = [cat for cat, _ in sorted_categories[:2]]
-
-        print(f"Content-based for {user_id}: Using categories {favorite_cats}")
-
-        # Calculate average price
-        avg_price = sum(price_list) / len(price_list) if price_list else 0
-
-        # Get candidate products
-        candidates = list(db.products.find({"category": {"$in": favorite_cats}}))
-
-        # Score each candidate
-        scored_products = []
-        for product in candidates:
-            product_id = str(product["_id"])
-            category = product.get("category", "Unknown")
-            price = product.get("price", 0)
-
-            # Category score
-            category_score = category_scores.get(category, 0)
-
-            # Price similarity (within ±40% is good)
-            if avg_price > 0:
-                price_diff = abs(price - avg_price) / avg_price
-                price_score = max(
-                    0, 1 - price_diff / 0.4
-                )  # Linear decay, 0 at 40% diff
-            else:
-                price_score = 0.5
+    # Shared product snapshot for all histories
+    history_ids = set(
+        i["product_id"] for interactions in interactions_by_user.values() for i in interactions
+    )
+    products_map = product_cache.get_many(history_ids)
 
-            # Composite score: 75% category, 25% price
-            final_score = (category_score * 0.75) + (
-                price_score * category_score * 0.25
-            )
+    return {
+        user_id: UserProfile(user_id, interactions_by_user.get(user_id, []), products_map)
+        for user_id in user_ids
+    }
+
+
+# ==================== SHARED SCORING STEPS ====================
+# Pure in-memory steps shared by the sync strategies below and their async
+# (Motor) counterparts, so both paths produce identical results.
+
+
+def favorite_categories(profile: UserProfile) -> List[str]:
+    """Categories covering the top 60% of the user's weighted interest"""
+
+    category_scores = profile.category_scores
+
+    # Get top categories (top 60% by weight)
+    total_weight = sum(category_scores.values())
+    sorted_categories = sorted(
+        category_scores.items(), key=lambda x: x[1], reverse=True
+    )
+
+    cumulative_weight = 0
+    favorite_cats = []
+    for cat, weight in sorted_categories:
+        favorite_cats.append(cat)
+        cumulative_weight += weight
+        if cumulative_weight >= total_weight * 0.6:  # Top 60% of weight
+            break
+
+    # Ensure at least 2 categories for diversity
+    if len(favorite_cats) < 2 and len(sorted_categories) >= 2:
+        favorite_cats = [cat for cat, _ in sorted_categories[:2]]
+
+    print(f"Content-based for {profile.user_id}: Using categories {favorite_cats}")
+
+    return favorite_cats
+
+
+def rank_content_candidates(
+    profile: UserProfile, favorite_cats: List[str], n: int
+) -> List[Dict]:
+    """
+    Score every catalog product in the favorite categories by category
+    preference and price fit, in one vectorized pass over the catalog
+    snapshot's columns; only the top candidates are copied out.
+    """
 
-            product["_id"] = str(product["_id"])
-            product["recommendation_score"] = final_score
+    category_scores = profile.category_scores
+    avg_price = profile.avg_price
+    columns = catalog.arrays()
+
+    # Per-category preference, indexed by category code
+    category_weights = np.zeros(len(columns.categories) + 1)
+    wanted_codes = []
+    for category in favorite_cats:
+        code = columns.category_index.get(category)
+        if code is not None:
+            category_weights[code] = category_scores.get(category, 0)
+            wanted_codes.append(code)
+
+    rows = np.flatnonzero(np.isin(columns.category_codes, wanted_codes))
+    category_score = category_weights[columns.category_codes[rows]]
+
+    # Price similarity (within ±40% is good): linear decay, 0 at 40% diff
+    if avg_price > 0:
+        price_diff = np.abs(columns.prices[rows] - avg_price) / avg_price
+        price_score = np.maximum(0, 1 - price_diff / 0.4)
+    else:
+        price_score = 0.5
+
+    # Composite score: 75% category, 25% price
+    final_scores = (category_score * 0.75) + (price_score * category_score * 0.25)
+
+    # Stable descending sort keeps catalog order among equal scores
+    order = np.argsort(-final_scores, kind="stable")[: n * CONFIG["diversity"]["candidate_pool"]]
+    top_ids = columns.product_ids[rows[order]]
+    products_map = catalog.get_many(top_ids)
+
+    scored_products = []
+    for product_id, score in zip(top_ids, final_scores[order]):
+        product = products_map.get(product_id)
+        if product:
+            product["recommendation_score"] = float(score)
             scored_products.append(product)
 
-        # Sort by score
-        scored_products.sort(key=lambda x: x["recommendation_score"], reverse=True)
+    # Apply diversity (extra candidates were kept above)
+    return diversify_recommendations(
+        scored_products,
+        n,
+        lambda_param=CONFIG["diversity"]["lambda"],
+    )
 
-        # Apply diversity (get more candidates, then diversify)
-        diversified = diversify_recommendations(
-            scored_products[: n * 3],  # Get 3x candidates
-            n,
-            lambda_param=CONFIG["diversity"]["lambda"],
+
+def collaborative_scores(profile: UserProfile) -> Dict[str, float]:
+    """Neighbour-weighted product scores; empty if no similar users"""
+
+    my_product_ids = profile.product_ids
+
+    # Find similar users on the resident sparse matrix (vectorized Jaccard)
+    top_similar_users = user_item_matrix.similar_users(
+        profile.user_id,
+        my_product_ids,
+        min_threshold=CONFIG["similarity"]["min_threshold"],
+        top_k=CONFIG["similarity"]["top_k_users"],
+    )
+
+    print(
+        f"Collaborative for {profile.user_id}: Found {len(top_similar_users)} similar users"
+    )
+
+    if not top_similar_users:
+        return {}
+
+    # Aggregate recommendations from similar users (similarity-weighted sum
+    # over the products they share with this user)
+    return user_item_matrix.score_items(top_similar_users, my_product_ids)
+
+
+def item_based_scores(profile: UserProfile) -> Dict[str, float]:
+    """History-weighted sum of item-item similarities"""
+
+    # O(history x K) neighbour lookups
+    product_scores = defaultdict(float)
+    for product_id, weight in profile.product_scores.items():
+        for neighbour_id, similarity in item_similarity_index.neighbours(product_id):
+            product_scores[neighbour_id] += weight * similarity
+
+    return product_scores
+
+
+def rank_scored_products(
+    product_scores: Dict[str, float], products_map: Dict[str, Dict], n: int
+) -> List[Dict]:
+    """Attach scores to fetched products, sort and diversify"""
+
+    scored_products = []
+    for product_id, score in product_scores.items():
+        product = products_map.get(product_id)
+        if product:
+            product["recommendation_score"] = score
+            scored_products.append(product)
+
+    # Sort by score
+    scored_products.sort(key=lambda x: x["recommendation_score"], reverse=True)
+
+    # Apply diversity
+    return diversify_recommendations(
+        scored_products[: n * CONFIG["diversity"]["candidate_pool"]],
+        n,
+        lambda_param=CONFIG["diversity"]["lambda"],
+    )
+
+
+def hybrid_content_weight(interaction_count: int) -> float:
+    """Share of the content-based score in the hybrid blend"""
+
+    if interaction_count < 5:
+        # Few interactions: 70% content, 30% collaborative
+        return 0.7
+    elif interaction_count < 15:
+        # Medium: 50/50
+        return 0.5
+    else:
+        # Many: 30% content, 70% collaborative
+        return 0.3
+
+
+def merge_hybrid(
+    content: List[Dict], collab: List[Dict], content_weight: float, n: int
+) -> List[Dict]:
+    """Weighted merge of content and collaborative lists plus a diversity pass"""
+
+    # Merge with weighted scoring
+    all_products = {}
+
+    for product in content:
+        pid = product["_id"]
+        all_products[pid] = product.copy()
+        all_products[pid]["recommendation_score"] = (
+            product["recommendation_score"] * content_weight
         )
 
-        return diversified
+    for product in collab:
+        pid = product["_id"]
+        if pid in all_products:
+            # Combine scores
+            all_products[pid]["recommendation_score"] += product[
+                "recommendation_score"
+            ] * (1 - content_weight)
+        else:
+            all_products[pid] = product.copy()
+            all_products[pid]["recommendation_score"] = product[
+                "recommendation_score"
+            ] * (1 - content_weight)
+
+    # Sort by combined score
+    merged = list(all_products.values())
+    merged.sort(key=lambda x: x["recommendation_score"], reverse=True)
+
+    # Apply final diversity pass
+    return diversify_recommendations(merged, n, lambda_param=0.65)
+
+
+def rank_popular(
+    top_product_ids: List[Tuple[str, float]], products_map: Dict[str, Dict], n: int
+) -> List[Dict]:
+    """Score and diversify leaderboard products"""
+
+    product_scores = dict(top_product_ids)
+
+    # Build products list with scores
+    products = []
+    for product_id, product in products_map.items():
+        product["recommendation_score"] = product_scores.get(product_id, 0)
+        products.append(product)
+
+    # Sort by score
+    products.sort(key=lambda x: x["recommendation_score"], reverse=True)
+
+    # Apply diversity
+    return diversify_recommendations(products, n, lambda_param=0.5)
+
+
+def _with_zero_score(products: List[Dict]) -> List[Dict]:
+    for product in products:
+        product["_id"] = str(product["_id"])
+        product["recommendation_score"] = 0
+    return products
+
+
+# ==================== CONTENT-BASED (OPTIMIZED) ====================
+
+
+def get_content_based_recommendations_balanced(
+    user_id: str,
+    n: int = 10,
+    profile: Optional[UserProfile] = None,
+) -> List[Dict]:
+    """Optimized content-based with diversity (candidates from the catalog snapshot)"""
+
+    try:
+        if profile is None:
+            profile = build_user_profile(user_id)
+
+        if not profile.interactions:
+            return get_popular_products(n)
+
+        favorite_cats = favorite_categories(profile)
+
+        return rank_content_candidates(profile, favorite_cats, n)
 
     except Exception as e:
         print(f"ERROR in content-based: {e}")
@@ -297,119 +684,66 @@ def get_content_based_recommendations_balanced(user_id: str, n: int = 10) -> Lis
 # ==================== COLLABORATIVE (OPTIMIZED) ====================
 
 
-def get_collaborative_recommendations_balanced(user_id: str, n: int = 10) -> List[Dict]:
+def get_collaborative_recommendations_balanced(
+    user_id: str,
+    n: int = 10,
+    profile: Optional[UserProfile] = None,
+) -> List[Dict]:
     """Optimized collaborative filtering with diversity"""
 
     try:
-        # Get user's interactions (with projection to reduce data transfer)
-        my_interactions = list(
-            db.interactions.find(
-                {"user_id": user_id}, {"product_id": 1, "interaction_type": 1, "timestamp": 1}
-            )
-        )
+        if profile is None:
+            profile = build_user_profile(user_id)
 
-        if not my_interactions:
+        if not profile.interactions:
             return get_popular_products(n)
 
-        # Calculate user's product preferences
-        my_product_scores = {}
-        my_product_ids = set()
+        product_scores = collaborative_scores(profile)
 
-        for interaction in my_interactions:
-            product_id = interaction["product_id"]
-            my_product_ids.add(product_id)
-            score = calculate_interaction_score(interaction)
-            my_product_scores[product_id] = my_product_scores.get(product_id, 0) + score
-
-        # Use aggregation pipeline to find similar users efficiently
-        # Get all users who interacted with the same products
-        pipeline = [
-            {"$match": {"product_id": {"$in": list(my_product_ids)}, "user_id": {"$ne": user_id}}},
-            {"$group": {
-                "_id": "$user_id",
-                "interactions": {"$push": {
-                    "product_id": "$product_id",
-                    "interaction_type": "$interaction_type",
-                    "timestamp": "$timestamp"
-                }}
-            }},
-            {"$limit": 100}  # Limit to top 100 users for performance
-        ]
-
-        potential_similar_users = list(db.interactions.aggregate(pipeline))
-        user_similarities = []
-
-        for user_doc in potential_similar_users:
-            other_user_id = user_doc["_id"]
-            their_interactions = user_doc["interactions"]
-            their_product_ids = set(i["product_id"] for i in their_interactions)
-
-            if not their_product_ids:
-                continue
+        if not product_scores:
+            return get_content_based_recommendations_balanced(user_id, n, profile)
 
-            # Calculate similarity
-            similarity = calculate_jaccard_similarity(my_product_ids, their_product_ids)
+        # Fetch and score products (one batched lookup)
+        products_map = product_cache.get_many(product_scores.keys())
 
-            if similarity >= CONFIG["similarity"]["min_threshold"]:
-                user_similarities.append(
-                    {
-                        "user_id": other_user_id,
-                        "similarity": similarity,
-                        "interactions": their_interactions,
-                    }
-                )
+        return rank_scored_products(product_scores, products_map, n)
 
-        # Sort by similarity
-        user_similarities.sort(key=lambda x: x["similarity"], reverse=True)
-        top_similar_users = user_similarities[: CONFIG["similarity"]["top_k_users"]]
+    except Exception as e:
+        print(f"ERROR in collaborative: {e}")
+        import traceback
 
-        print(
-            f"Collaborative for {user_id}: Found {len(top_similar_users)} similar users"
-        )
+        traceback.print_exc()
+        return get_popular_products(n)
 
-        if not top_similar_users:
-            return get_content_based_recommendations_balanced(user_id, n)
 
-        # Aggregate recommendations from similar users
-        product_scores = defaultdict(float)
+# ==================== ITEM-BASED ====================
 
-        for similar_user in top_similar_users:
-            similarity = similar_user["similarity"]
 
-            for interaction in similar_user["interactions"]:
-                product_id = interaction["product_id"]
+def get_item_based_recommendations(
+    user_id: str,
+    n: int = 10,
+    profile: Optional[UserProfile] = None,
+) -> List[Dict]:
+    """Item-based filtering from the precomputed item-item similarity index"""
 
-                # Skip if user already interacted
-                # if product_id in my_product_ids:
-                #     continue
+    try:
+        if profile is None:
+            profile = build_user_profile(user_id)
 
-                interaction_score = calculate_interaction_score(interaction)
-                product_scores[product_id] += interaction_score * similarity
+        if not profile.interactions:
+            return get_popular_products(n)
 
-        # Fetch and score products
-        scored_products = []
-        for product_id, score in product_scores.items():
-            try:
-                product = db.products.find_one({"_id": ObjectId(product_id)})
-                if product:
-                    product["_id"] = str(product["_id"])
-                    product["recommendation_score"] = score
-                    scored_products.append(product)
-            except:
-                continue
+        product_scores = item_based_scores(profile)
 
-        # Sort by score
-        scored_products.sort(key=lambda x: x["recommendation_score"], reverse=True)
+        if not product_scores:
+            return get_content_based_recommendations_balanced(user_id, n, profile)
 
-        # Apply diversity
-        diversified = diversify_recommendations(
-            scored_products[: n * 3], n, lambda_param=CONFIG["diversity"]["lambda"]
-        )
+        products_map = product_cache.get_many(product_scores.keys())
 
-        return diversified
+        return rank_scored_products(product_scores, products_map, n)
 
     except Exception as e:
-        print(f"ERROR in collaborative: {e}")
+        print(f"ERROR in item-based: {e}")
         import traceback
 
         traceback.print_exc()
@@ -419,62 +753,28 @@ def get_collaborative_recommendations_balanced(user_id: str, n: int = 10) -> Lis
 # ==================== HYBRID (OPTIMIZED) ====================
 
 
-def get_hybrid_recommendations_balanced(user_id: str, n: int = 10) -> List[Dict]:
+def get_hybrid_recommendations_balanced(
+    user_id: str,
+    n: int = 10,
+    profile: Optional[UserProfile] = None,
+) -> List[Dict]:
     """Smart hybrid with diversity preservation"""
 
     try:
-        # Get recommendations from both methods
-        interaction_count = db.interactions.count_documents({"user_id": user_id})
+        # One interactions read shared by both strategies
+        if profile is None:
+            profile = build_user_profile(user_id)
 
-        if interaction_count == 0:
+        if profile.interaction_count == 0:
             return get_popular_products(n)
-        elif interaction_count < 5:
-            # Few interactions: 70% content, 30% collaborative
-            content = get_content_based_recommendations_balanced(user_id, n)
-            collab = get_collaborative_recommendations_balanced(user_id, n)
-            content_weight = 0.7
-        elif interaction_count < 15:
-            # Medium: 50/50
-            content = get_content_based_recommendations_balanced(user_id, n)
-            collab = get_collaborative_recommendations_balanced(user_id, n)
-            content_weight = 0.5
-        else:
-            # Many: 30% content, 70% collaborative
-            content = get_content_based_recommendations_balanced(user_id, n)
-            collab = get_collaborative_recommendations_balanced(user_id, n)
-            content_weight = 0.3
-
-        # Merge with weighted scoring
-        all_products = {}
-
-        for product in content:
-            pid = product["_id"]
-            all_products[pid] = product.copy()
-            all_products[pid]["recommendation_score"] = (
-                product["recommendation_score"] * content_weight
-            )
-
-        for product in collab:
-            pid = product["_id"]
-            if pid in all_products:
-                # Combine scores
-                all_products[pid]["recommendation_score"] += product[
-                    "recommendation_score"
-                ] * (1 - content_weight)
-            else:
-                all_products[pid] = product.copy()
-                all_products[pid]["recommendation_score"] = product[
-                    "recommendation_score"
-                ] * (1 - content_weight)
 
-        # Sort by combined score
-        merged = list(all_products.values())
-        merged.sort(key=lambda x: x["recommendation_score"], reverse=True)
+        content_weight = hybrid_content_weight(profile.interaction_count)
 
-        # Apply final diversity pass
-        result = diversify_recommendations(merged, n, lambda_param=0.65)
+        # Get recommendations from both methods
+        content = get_content_based_recommendations_balanced(user_id, n, profile)
+        collab = get_collaborative_recommendations_balanced(user_id, n, profile)
 
-        return result
+        return merge_hybrid(content, collab, content_weight, n)
 
     except Exception as e:
         print(f"ERROR in hybrid: {e}")
@@ -485,92 +785,258 @@ def get_hybrid_recommendations_balanced(user_id: str, n: int = 10) -> List[Dict]
 
 
 def get_popular_products(n: int = 10) -> List[Dict]:
-    """Get diverse popular products using aggregation for better performance"""
+    """Get diverse popular products from the materialized leaderboard"""
 
     try:
-        # Use aggregation pipeline to calculate scores efficiently
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$product_id",
-                    "interactions": {"$push": {
-                        "interaction_type": "$interaction_type",
-                        "timestamp": "$timestamp"
-                    }}
-                }
-            },
-            {"$limit": 100}  # Limit for performance
-        ]
-
-        interaction_groups = list(db.interactions.aggregate(pipeline))
-
-        product_scores = {}
-        for group in interaction_groups:
-            product_id = group["_id"]
-            total_score = 0
-            for interaction in group["interactions"]:
-                score = calculate_interaction_score(interaction)
-                total_score += score
-            product_scores[product_id] = total_score
-
-        # Sort by score and get top product IDs
-        top_product_ids = sorted(
-            product_scores.items(), key=lambda x: x[1], reverse=True
-        )[:n * 3]  # Get 3x for diversity filtering
+        # Read the ready-sorted leaderboard (extra items for diversity filtering)
+        top_product_ids = popularity_leaderboard.top(n * CONFIG["diversity"]["candidate_pool"])
 
         # Fetch all top products in one query
-        product_id_list = [pid for pid, score in top_product_ids]
-        products_cursor = db.products.find(
-            {"_id": {"$in": [ObjectId(pid) for pid in product_id_list]}}
+        products_map = product_cache.get_many(pid for pid, score in top_product_ids)
+
+        diversified = rank_popular(top_product_ids, products_map, n)
+
+        # Fill with random if needed
+        if len(diversified) < n:
+            existing_ids = set(p["_id"] for p in diversified)
+            random_products = catalog.first(n - len(diversified), exclude=existing_ids)
+            diversified.extend(_with_zero_score(random_products))
+
+        return diversified[:n]
+
+    except:
+        return _with_zero_score(list(db.products.find().limit(n)))
+
+
+# ==================== BATCH ====================
+
+RECOMMENDERS = {
+    "collaborative": get_collaborative_recommendations_balanced,
+    "content": get_content_based_recommendations_balanced,
+    "item": get_item_based_recommendations,
+    "hybrid": get_hybrid_recommendations_balanced,
+}
+
+
+def get_batch_recommendations(
+    user_ids: List[str], method: str = "hybrid", n: int = 10
+) -> Iterator[Dict]:
+    """
+    Recommendations for many users, yielded one result per user in request
+    order. All users' interactions are loaded with one query, their history
+    products with one batched lookup and content candidates from the shared
+    catalog snapshot; scoring goes through the same strategy functions as the
+    single-user endpoint, so results match it.
+    """
+
+    recommender = RECOMMENDERS[method]
+    user_ids = list(dict.fromkeys(user_ids))
+
+    # Validate all users in one query
+    object_ids = []
+    for user_id in user_ids:
+        try:
+            object_ids.append(ObjectId(user_id))
+        except Exception:
+            continue
+    usernames = {
+        str(u["_id"]): u.get("username", "unknown")
+        for u in db.users.find({"_id": {"$in": object_ids}}, {"username": 1})
+    }
+
+    # Serve what we can from the result cache, compute the rest together
+    cached = {}
+    for user_id in usernames:
+        recommendations = recommendation_cache.get(user_id, method, n)
+        if recommendations is not None:
+            cached[user_id] = recommendations
+    to_compute = [user_id for user_id in user_ids if user_id in usernames and user_id not in cached]
+    cache_versions = {user_id: recommendation_cache.version(user_id) for user_id in to_compute}
+
+    profiles = build_user_profiles(to_compute)
+
+    for user_id in user_ids:
+        if user_id not in usernames:
+            yield {"user_id": user_id, "error": "User not found"}
+            continue
+
+        if user_id in cached:
+            recommendations = cached[user_id]
+        else:
+            recommendations = recommender(user_id, n, profiles[user_id])
+            recommendation_cache.put(user_id, method, n, recommendations, cache_versions[user_id])
+
+        yield {
+            "user_id": user_id,
+            "username": usernames[user_id],
+            "method": method,
+            "count": len(recommendations),
+            "recommendations": recommendations,
+        }
+
+
+# ==================== ASYNC (MOTOR) ====================
+# Same strategies for the async endpoints: MongoDB I/O goes through Motor,
+# scoring reuses the shared steps above. In-memory indexes that would need a
+# (blocking) rebuild are refreshed in a worker thread first.
+
+
+async def _ensure_indexes_fresh(*, matrix: bool = False, items: bool = False, products: bool = False):
+    if matrix and not user_item_matrix.is_built():
+        await asyncio.to_thread(user_item_matrix.snapshot)
+    if items and not item_similarity_index.is_built():
+        await asyncio.to_thread(item_similarity_index.ensure_built)
+    if products and not catalog.is_loaded():
+        await asyncio.to_thread(catalog.ensure_loaded)
+
+
+async def build_user_profile_async(user_id: str) -> UserProfile:
+    """build_user_profile through Motor"""
+
+    cursor = get_async_db().interactions.find({"user_id": user_id}, PROFILE_PROJECTION)
+    interactions = await cursor.to_list(length=None)
+
+    product_ids = set(i["product_id"] for i in interactions)
+    products_map = await product_cache.get_many_async(product_ids)
+
+    return UserProfile(user_id, interactions, products_map)
+
+
+async def get_content_based_recommendations_async(
+    user_id: str, n: int = 10, profile: Optional[UserProfile] = None
+) -> List[Dict]:
+    try:
+        if profile is None:
+            profile = await build_user_profile_async(user_id)
+
+        if not profile.interactions:
+            return await get_popular_products_async(n)
+
+        await _ensure_indexes_fresh(products=True)
+        favorite_cats = favorite_categories(profile)
+
+        return rank_content_candidates(profile, favorite_cats, n)
+
+    except Exception as e:
+        print(f"ERROR in content-based (async): {e}")
+        import traceback
+
+        traceback.print_exc()
+        return await get_popular_products_async(n)
+
+
+async def get_collaborative_recommendations_async(
+    user_id: str, n: int = 10, profile: Optional[UserProfile] = None
+) -> List[Dict]:
+    try:
+        if profile is None:
+            profile = await build_user_profile_async(user_id)
+
+        if not profile.interactions:
+            return await get_popular_products_async(n)
+
+        await _ensure_indexes_fresh(matrix=True)
+        product_scores = collaborative_scores(profile)
+
+        if not product_scores:
+            return await get_content_based_recommendations_async(user_id, n, profile)
+
+        products_map = await product_cache.get_many_async(product_scores.keys())
+
+        return rank_scored_products(product_scores, products_map, n)
+
+    except Exception as e:
+        print(f"ERROR in collaborative (async): {e}")
+        import traceback
+
+        traceback.print_exc()
+        return await get_popular_products_async(n)
+
+
+async def get_item_based_recommendations_async(
+    user_id: str, n: int = 10, profile: Optional[UserProfile] = None
+) -> List[Dict]:
+    try:
+        if profile is None:
+            profile = await build_user_profile_async(user_id)
+
+        if not profile.interactions:
+            return await get_popular_products_async(n)
+
+        await _ensure_indexes_fresh(items=True)
+        product_scores = item_based_scores(profile)
+
+        if not product_scores:
+            return await get_content_based_recommendations_async(user_id, n, profile)
+
+        products_map = await product_cache.get_many_async(product_scores.keys())
+
+        return rank_scored_products(product_scores, products_map, n)
+
+    except Exception as e:
+        print(f"ERROR in item-based (async): {e}")
+        import traceback
+
+        traceback.print_exc()
+        return await get_popular_products_async(n)
+
+
+async def get_hybrid_recommendations_async(user_id: str, n: int = 10) -> List[Dict]:
+    try:
+        profile = await build_user_profile_async(user_id)
+
+        if profile.interaction_count == 0:
+            return await get_popular_products_async(n)
+
+        content_weight = hybrid_content_weight(profile.interaction_count)
+
+        # Content and collaborative sub-queries run concurrently
+        content, collab = await asyncio.gather(
+            get_content_based_recommendations_async(user_id, n, profile),
+            get_collaborative_recommendations_async(user_id, n, profile),
         )
 
-        # Build products list with scores
-        products = []
-        for product in products_cursor:
-            product_id = str(product["_id"])
-            product["_id"] = product_id
-            product["recommendation_score"] = product_scores.get(product_id, 0)
-            products.append(product)
+        return merge_hybrid(content, collab, content_weight, n)
+
+    except Exception as e:
+        print(f"ERROR in hybrid (async): {e}")
+        return await get_popular_products_async(n)
+
+
+async def get_popular_products_async(n: int = 10) -> List[Dict]:
+    products = get_async_db().products
 
-        # Sort by score
-        products.sort(key=lambda x: x["recommendation_score"], reverse=True)
+    try:
+        if not popularity_leaderboard.is_built():
+            await asyncio.to_thread(popularity_leaderboard.ensure_fresh)
+
+        top_product_ids = popularity_leaderboard.top(n * CONFIG["diversity"]["candidate_pool"])
+        products_map = await product_cache.get_many_async(pid for pid, score in top_product_ids)
 
-        # Apply diversity
-        diversified = diversify_recommendations(products, n, lambda_param=0.5)
+        diversified = rank_popular(top_product_ids, products_map, n)
 
         # Fill with random if needed
         if len(diversified) < n:
+            await _ensure_indexes_fresh(products=True)
             existing_ids = set(p["_id"] for p in diversified)
-            random_products = list(
-                db.products.find(
-                    {"_id": {"$nin": [ObjectId(pid) for pid in existing_ids]}}
-                ).limit(n - len(diversified))
-            )
-
-            for product in random_products:
-                product["_id"] = str(product["_id"])
-                product["recommendation_score"] = 0
-                diversified.append(product)
+            random_products = catalog.first(n - len(diversified), exclude=existing_ids)
+            diversified.extend(_with_zero_score(random_products))
 
         return diversified[:n]
 
-    except:
-        products = list(db.products.find().limit(n))
-        for product in products:
-            product["_id"] = str(product["_id"])
-            product["recommendation_score"] = 0
-        return products
+    except Exception:
+        return _with_zero_score(await products.find().limit(n).to_list(length=None))
 
 
 # ==================== API ENDPOINTS ====================
 
 
 @router.get("/api/recommendations/popular")
-def get_popular_products_endpoint(n: int = Query(10, ge=1, le=50)):
+async def get_popular_products_endpoint(n: int = Query(10, ge=1, le=50)):
     """Get popular products based on user interactions"""
 
     try:
-        popular_products = get_popular_products(n)
+        popular_products = await get_popular_products_async(n)
 
         return {
             "method": "popular",
@@ -585,13 +1051,49 @@ def get_popular_products_endpoint(n: int = Query(10, ge=1, le=50)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/api/recommendations/cache/stats")
+def get_recommendation_cache_stats():
+    """Hit/miss counters of the recommendation result cache"""
+    return recommendation_cache.stats()
+
+
+class BatchRecommendationRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    method: str = Field("hybrid", pattern="^(collaborative|content|hybrid|item)$")
+    n: int = Field(10, ge=1, le=50)
+
+
+@router.post("/api/recommendations/batch")
+def get_batch_recommendations_endpoint(request: BatchRecommendationRequest):
+    """Recommendations for many users, streamed back as NDJSON (one user per line)"""
+
+    def stream():
+        try:
+            for result in get_batch_recommendations(request.user_ids, request.method, request.n):
+                yield json.dumps(jsonable_encoder(result)) + "\n"
+        except Exception as e:
+            print(f"ERROR in batch recommendations: {e}")
+            import traceback
+
+            traceback.print_exc()
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @router.get("/api/recommendations/{user_id}")
-def get_recommendations(
+async def get_recommendations(
     user_id: str,
     n: int = Query(10, ge=1, le=50),
-    method: str = Query("hybrid", regex="^(collaborative|content|hybrid)$"),
+    method: str = Query("hybrid", regex="^(collaborative|content|hybrid|item)$"),
+    source: str = Query("online", regex="^(online|precomputed)$"),
 ):
-    """Get balanced recommendations (high accuracy + high diversity)"""
+    """
+    Get balanced recommendations (high accuracy + high diversity)
+
+    source=precomputed serves the list written by precompute_recommendations.py
+    with one `_id` read and falls back to online compute on a miss.
+    """
 
     try:
         # Validate ObjectId format first
@@ -600,21 +1102,43 @@ def get_recommendations(
         except Exception:
             raise HTTPException(status_code=404, detail="User not found")
 
-        user = db.users.find_one({"_id": user_object_id})
+        user = await get_async_db().users.find_one({"_id": user_object_id}, {"username": 1})
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        if method == "collaborative":
-            recommendations = get_collaborative_recommendations_balanced(user_id, n)
-        elif method == "content":
-            recommendations = get_content_based_recommendations_balanced(user_id, n)
-        else:
-            recommendations = get_hybrid_recommendations_balanced(user_id, n)
+        served_from = "online"
+        recommendations = None
+
+        if source == "precomputed":
+            precomputed = await get_async_db()[PRECOMPUTED_COLLECTION].find_one(
+                {"_id": precomputed_key(user_id, method, n)}, {"recommendations": 1}
+            )
+            if precomputed is not None:
+                recommendations = precomputed["recommendations"]
+                served_from = "precomputed"
+
+        if recommendations is None:
+            recommendations = recommendation_cache.get(user_id, method, n)
+
+        if recommendations is None:
+            cache_version = recommendation_cache.version(user_id)
+
+            if method == "collaborative":
+                recommendations = await get_collaborative_recommendations_async(user_id, n)
+            elif method == "content":
+                recommendations = await get_content_based_recommendations_async(user_id, n)
+            elif method == "item":
+                recommendations = await get_item_based_recommendations_async(user_id, n)
+            else:
+                recommendations = await get_hybrid_recommendations_async(user_id, n)
+
+            recommendation_cache.put(user_id, method, n, recommendations, cache_version)
 
         return {
             "user_id": user_id,
             "username": user.get("username", "unknown"),
             "method": method,
+            "source": served_from,
             "count": len(recommendations),
             "recommendations": recommendations,
         }
@@ -0,0 +1,218 @@
+"""
+In-process inverted index over product names and descriptions.
+
+Fallback for `GET /api/products?search=` when the MongoDB `$text` index finds
+nothing (or is unavailable). `$text` only matches whole stemmed words; this
+index also matches prefixes ("lap" -> "laptop") and single typos
+("laptpo" -> "laptop", edit distance 1).
+
+Scoring mirrors the text index weights: a token in the name counts more than
+one in the description, exact matches count more than prefix or typo matches.
+
+The index is built from the in-memory catalog snapshot, not from MongoDB.
+After a product write it is rebuilt once in a background thread while
+searches keep using the current index; only the very first build runs on the
+request path.
+"""
+
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from catalog import catalog
+
+# Same relative weights as the `product_text` index in indexes.INDEXES
+FIELD_WEIGHTS = {"name": 10.0, "description": 2.0}
+PREFIX_FACTOR = 0.5
+TYPO_FACTOR = 0.3
+MIN_FUZZY_LENGTH = 3
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if a and b differ by at most one insert, delete, substitute or swap"""
+    if a == b:
+        return True
+    len_a, len_b = len(a), len(b)
+    if abs(len_a - len_b) > 1:
+        return False
+    if len_a > len_b:
+        a, b, len_a, len_b = b, a, len_b, len_a
+
+    i = 0
+    while i < len_a and a[i] == b[i]:
+        i += 1
+
+    if len_a == len_b:
+        # One substitution, or one transposition of adjacent characters
+        return a[i + 1:] == b[i + 1:] or (
+            i + 1 < len_a and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+        )
+    # One insertion into the shorter string
+    return a[i:] == b[i + 1:]
+
+
+class ProductSearchIndex:
+    """Token -> {product_id: weight} postings with prefix and typo lookup"""
+
+    def __init__(self, catalog_snapshot, refresh_seconds: float = 300.0):
+        self._catalog = catalog_snapshot
+        self.refresh_seconds = refresh_seconds
+
+        # _lock guards the postings; _build_lock lets only one build run at a time
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built_at: Optional[float] = None
+        self._stale = False
+        self._refreshing = False
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._tokens: List[str] = []
+        self._tokens_by_length: Dict[int, List[str]] = {}
+        self._categories: Dict[str, str] = {}
+
+    # ==================== BUILD ====================
+
+    def build(self):
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        start = time.time()
+
+        postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        categories: Dict[str, str] = {}
+
+        for product_id, product in self._catalog.products().items():
+            categories[product_id] = product.get("category")
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(product.get(field)):
+                    posting = postings[token]
+                    posting[product_id] = posting.get(product_id, 0.0) + weight
+
+        tokens = sorted(postings)
+        tokens_by_length: Dict[int, List[str]] = defaultdict(list)
+        for token in tokens:
+            tokens_by_length[len(token)].append(token)
+
+        with self._lock:
+            self._postings = dict(postings)
+            self._tokens = tokens
+            self._tokens_by_length = dict(tokens_by_length)
+            self._categories = categories
+            self._built_at = time.time()
+
+        print(
+            f"[OPTIMIZATION] Search index built: {len(categories)} products, {len(tokens)} tokens "
+            f"in {(time.time() - start) * 1000:.1f}ms"
+        )
+
+    def ensure_built(self):
+        """
+        Build synchronously only when there is no index yet; a stale index is
+        served while it is rebuilt in the background.
+        """
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self._build()
+            return
+
+        if self._stale or time.time() - self._built_at >= self.refresh_seconds:
+            self._refresh_in_background()
+
+    def invalidate(self, product_id: Optional[str] = None):
+        """Rebuild after a product write (or a catalog change listener call)"""
+        self._stale = True
+        if self._built_at is not None:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="search-index", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            # Writes that arrive during a build mark the index stale again
+            while True:
+                self._stale = False
+                self.build()
+                if not self._stale:
+                    break
+        except Exception as e:
+            print(f"ERROR rebuilding search index: {e}")
+        finally:
+            self._refreshing = False
+
+    # ==================== QUERIES ====================
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Index tokens matching a query term, with their match factor"""
+        matches: Dict[str, float] = {}
+        if term in self._postings:
+            matches[term] = 1.0
+
+        if len(term) >= MIN_FUZZY_LENGTH:
+            start = bisect.bisect_left(self._tokens, term)
+            for token in self._tokens[start:]:
+                if not token.startswith(term):
+                    break
+                matches.setdefault(token, PREFIX_FACTOR)
+
+            for length in (len(term) - 1, len(term), len(term) + 1):
+                for token in self._tokens_by_length.get(length, ()):
+                    if token not in matches and _within_one_edit(term, token):
+                        matches[token] = TYPO_FACTOR
+
+        return list(matches.items())
+
+    def search(
+        self, query: str, category: Optional[str] = None, limit: Optional[int] = 50
+    ) -> List[Tuple[str, float]]:
+        """
+        (product_id, score) pairs, best first. Like `$text`, a product matches
+        if any query term matches; scores of the matching terms add up.
+        `limit=None` returns every match.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        self.ensure_built()
+
+        with self._lock:
+            scores: Dict[str, float] = defaultdict(float)
+            for term in terms:
+                term_scores: Dict[str, float] = {}
+                for token, factor in self._expand(term):
+                    for product_id, weight in self._postings[token].items():
+                        score = weight * factor
+                        if score > term_scores.get(product_id, 0.0):
+                            term_scores[product_id] = score
+                for product_id, score in term_scores.items():
+                    scores[product_id] += score
+
+            if category:
+                scores = {
+                    product_id: score
+                    for product_id, score in scores.items()
+                    if self._categories.get(product_id) == category
+                }
+
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return ranked if limit is None else ranked[:limit]
+
+
+# Process-wide instance shared by all modules
+product_search_index = ProductSearchIndex(catalog)
+catalog.subscribe(product_search_index.invalidate)
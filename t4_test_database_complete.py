@@ -419,7 +419,7 @@ class DatabaseTester:
     def test_indexing(self):
         self.print_section("3A. INDEXING VERIFICATION")
 
-        # Expected indexes based on main.py create_indexes()
+        # Expected indexes based on indexes.INDEXES
         expected_indexes = {
             "users": ["email", "username"],
             "products": ["category", "name"],
@@ -0,0 +1,209 @@
+"""
+Checkout Reservation Tests (two-phase path)
+Checks that inventory.place_order never leaves stock decremented for an order
+that does not exist:
+1. Happy path
+2. Reservation bulk_write failing part-way
+3. Order insert failing
+4. Order insert failing and the existence check failing too
+5. Crash recovery via recover_pending_orders (order missing / order written)
+
+Runs against its own database (MONGO_DB_NAME, default ecommerce_db_checkout_test),
+which is dropped at the end.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_DB_NAME", "ecommerce_db_checkout_test")
+
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+import database
+import inventory
+
+# Fix Windows encoding
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+
+class FailingCollection:
+    """Proxy that makes one call of each given method fail, optionally after doing part of the work"""
+
+    def __init__(self, collection, *methods, partial=False):
+        self._collection = collection
+        self._methods = set(methods)
+        self._partial = partial
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in self._methods:
+            return attr
+
+        def fail(operations_or_doc, *args, **kwargs):
+            self._methods.discard(name)
+            if self._partial:
+                # Apply the first operation only, then lose the connection
+                attr(operations_or_doc[:1], *args, **kwargs)
+            raise AutoReconnect("simulated connection loss")
+
+        return fail
+
+
+class CheckoutReservationTester:
+    def __init__(self):
+        self.db = database.get_db()
+        self.passed = 0
+        self.total = 0
+        inventory._transactions_supported = False  # exercise the two-phase path
+
+    def print_section(self, title):
+        print("\n" + "="*70)
+        print(f"  {title}")
+        print("="*70 + "\n")
+
+    def check(self, name, condition):
+        self.total += 1
+        if condition:
+            self.passed += 1
+            print(f"  [PASS] {name}")
+        else:
+            print(f"  [FAIL] {name}")
+
+    def setup_products(self):
+        self.db.products.delete_many({})
+        self.db.orders.delete_many({})
+        self.db.pending_orders.delete_many({})
+        ids = self.db.products.insert_many([
+            {"name": "Reservation Test A", "price": 10.0, "stock_quantity": 5},
+            {"name": "Reservation Test B", "price": 20.0, "stock_quantity": 5},
+        ]).inserted_ids
+        return {str(pid): 2 for pid in ids}
+
+    def stock(self, quantities):
+        return [self.db.products.find_one({"_id": ObjectId(pid)})["stock_quantity"] for pid in quantities]
+
+    def clean(self, quantities):
+        """No reservation tags left and no pending marker"""
+        tagged = self.db.products.count_documents(
+            {"_id": {"$in": [ObjectId(pid) for pid in quantities]}, "reservations": {"$exists": True}}
+        )
+        return tagged == 0 and self.db.pending_orders.count_documents({}) == 0
+
+    def order(self):
+        return {"user_id": "reservation-test-user", "items": [], "total": 0, "created_at": datetime.utcnow()}
+
+    # ============================================================
+    def test_happy_path(self):
+        self.print_section("1. HAPPY PATH")
+        quantities = self.setup_products()
+        order_id = inventory.place_order(self.order(), quantities)
+        self.check("stock decremented", self.stock(quantities) == [3, 3])
+        self.check("order written", self.db.orders.count_documents({"_id": order_id}) == 1)
+        self.check("no tags or marker left", self.clean(quantities))
+
+    def test_partial_reservation_failure(self):
+        self.print_section("2. RESERVATION BULK WRITE FAILS PART-WAY")
+        quantities = self.setup_products()
+        original = inventory.products_collection
+        inventory.products_collection = FailingCollection(original, "bulk_write", partial=True)
+        try:
+            inventory.place_order(self.order(), quantities)
+            raised = False
+        except AutoReconnect:
+            raised = True
+        finally:
+            inventory.products_collection = original
+
+        self.check("error propagated", raised)
+        self.check("stock restored", self.stock(quantities) == [5, 5])
+        self.check("no tags or marker left", self.clean(quantities))
+        self.check("no order written", self.db.orders.count_documents({}) == 0)
+
+    def test_order_insert_failure(self):
+        self.print_section("3. ORDER INSERT FAILS")
+        quantities = self.setup_products()
+        original = inventory.orders_collection
+        inventory.orders_collection = FailingCollection(original, "insert_one")
+        try:
+            inventory.place_order(self.order(), quantities)
+            raised = False
+        except AutoReconnect:
+            raised = True
+        finally:
+            inventory.orders_collection = original
+
+        self.check("error propagated", raised)
+        self.check("stock restored", self.stock(quantities) == [5, 5])
+        self.check("no tags or marker left", self.clean(quantities))
+
+    def test_order_check_failure(self):
+        self.print_section("4. ORDER INSERT AND EXISTENCE CHECK FAIL")
+        quantities = self.setup_products()
+        original = inventory.orders_collection
+        inventory.orders_collection = FailingCollection(original, "insert_one", "count_documents")
+        try:
+            inventory.place_order(self.order(), quantities)
+            raised = False
+        except AutoReconnect:
+            raised = True
+        finally:
+            inventory.orders_collection = original
+
+        self.check("error propagated", raised)
+        self.check("reservation kept", self.stock(quantities) == [3, 3])
+        self.check("marker kept for recovery", self.db.pending_orders.count_documents({}) == 1)
+
+        inventory.recover_pending_orders(max_age_seconds=0)
+        self.check("recovery restored stock", self.stock(quantities) == [5, 5])
+        self.check("no tags or marker left", self.clean(quantities))
+
+    def simulate_crash(self, quantities, write_order):
+        """State left by a process that died after reserving (and maybe inserting the order)"""
+        order_id = ObjectId()
+        self.db.pending_orders.insert_one({
+            "_id": order_id,
+            "user_id": "reservation-test-user",
+            "quantities": quantities,
+            "created_at": datetime.utcnow() - timedelta(minutes=10),
+        })
+        self.db.products.bulk_write(inventory._decrement_ops(quantities, order_id))
+        if write_order:
+            self.db.orders.insert_one({"_id": order_id, **self.order()})
+        return order_id
+
+    def test_recovery(self):
+        self.print_section("5. CRASH RECOVERY")
+        quantities = self.setup_products()
+        self.simulate_crash(quantities, write_order=False)
+        self.check("reserved before recovery", self.stock(quantities) == [3, 3])
+        recovered = inventory.recover_pending_orders()
+        self.check("one checkout recovered", recovered == 1)
+        self.check("stock restored (order never written)", self.stock(quantities) == [5, 5])
+        self.check("no tags or marker left", self.clean(quantities))
+
+        quantities = self.setup_products()
+        self.simulate_crash(quantities, write_order=True)
+        inventory.recover_pending_orders()
+        self.check("stock kept (order was written)", self.stock(quantities) == [3, 3])
+        self.check("no tags or marker left", self.clean(quantities))
+
+    def run(self):
+        try:
+            self.test_happy_path()
+            self.test_partial_reservation_failure()
+            self.test_order_insert_failure()
+            self.test_order_check_failure()
+            self.test_recovery()
+        finally:
+            database.get_client().drop_database(database.DB_NAME)
+
+        print(f"\n>>> {self.passed}/{self.total} checks passed\n")
+        return self.passed == self.total
+
+
+if __name__ == "__main__":
+    sys.exit(0 if CheckoutReservationTester().run() else 1)
@@ -0,0 +1,168 @@
+"""
+Diversification Regression Test
+Compares recommendation_routes.diversify_recommendations (per-category heaps)
+against the original O(k·n·k) MMR loop on seeded random candidate lists:
+1. Identical selections over many random inputs (scores, ties, missing
+   scores/categories, unsorted input, every lambda and category cap)
+2. Timing of both versions on a large candidate pool
+
+No database is needed.
+"""
+
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List
+
+from recommendation_routes import CONFIG, diversify_recommendations
+
+# Fix Windows encoding
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+SEED = 7
+TRIALS = 20000
+
+
+def reference_diversify(
+    candidates: List[Dict], max_results: int, lambda_param: float = 0.6
+) -> List[Dict]:
+    """The original MMR implementation, kept verbatim as the reference"""
+
+    if not CONFIG["diversity"]["enabled"]:
+        return candidates[:max_results]
+
+    if len(candidates) <= max_results:
+        return candidates
+
+    selected = []
+    remaining = candidates.copy()
+    category_counts = Counter()
+    max_per_category = CONFIG["diversity"]["max_per_category"]
+
+    # First, add the highest scoring item
+    if remaining:
+        best = remaining.pop(0)
+        selected.append(best)
+        category_counts[best.get("category")] += 1
+
+    # Iteratively select items that balance relevance and diversity
+    while len(selected) < max_results and remaining:
+        best_score = -float("inf")
+        best_idx = 0
+
+        for idx, candidate in enumerate(remaining):
+            category = candidate.get("category")
+
+            # Hard limit on category repetition
+            if category_counts[category] >= max_per_category:
+                continue
+
+            # Relevance score (normalized)
+            relevance = candidate.get("recommendation_score", 0)
+            max_relevance = candidates[0].get("recommendation_score", 1)
+            normalized_relevance = relevance / max_relevance if max_relevance > 0 else 0
+
+            # Diversity penalty (how similar to already selected items)
+            diversity_penalty = 0
+            for selected_item in selected:
+                if selected_item.get("category") == category:
+                    diversity_penalty += 0.5  # Same category penalty
+
+            # Normalize diversity penalty
+            max_penalty = len(selected) * 0.5
+            normalized_penalty = (
+                diversity_penalty / max_penalty if max_penalty > 0 else 0
+            )
+
+            # MMR score
+            mmr_score = (lambda_param * normalized_relevance) - (
+                (1 - lambda_param) * normalized_penalty
+            )
+
+            if mmr_score > best_score:
+                best_score = mmr_score
+                best_idx = idx
+
+        # Add best item
+        if remaining:
+            selected_item = remaining.pop(best_idx)
+            selected.append(selected_item)
+            category_counts[selected_item.get("category")] += 1
+
+    return selected
+
+
+def print_section(title):
+    print("\n" + "="*70)
+    print(f"  {title}")
+    print("="*70 + "\n")
+
+
+def random_candidates(rng: random.Random) -> List[Dict]:
+    categories = rng.choice([["A"], ["A", "B"], list("ABCDE"), list("ABCDEFGHIJ"), [None, "A"]])
+    candidates = []
+    for i in range(rng.randint(0, 40)):
+        candidate = {"_id": i, "category": rng.choice(categories)}
+        roll = rng.random()
+        if roll < 0.05:
+            pass  # no score at all
+        elif roll < 0.3:
+            candidate["recommendation_score"] = rng.choice([0, 1, 2, 5, 10])  # ties
+        else:
+            candidate["recommendation_score"] = rng.uniform(0, 50)
+        candidates.append(candidate)
+    if rng.random() < 0.7:
+        candidates.sort(key=lambda c: c.get("recommendation_score", 0), reverse=True)
+    return candidates
+
+
+def test_equivalence() -> bool:
+    print_section("1. SAME SELECTIONS AS THE REFERENCE")
+    rng = random.Random(SEED)
+    saved_cap = CONFIG["diversity"]["max_per_category"]
+    mismatches = []
+    try:
+        for trial in range(TRIALS):
+            candidates = random_candidates(rng)
+            max_results = rng.randint(1, 15)
+            lambda_param = rng.choice([0, 0.3, 0.5, 0.6, 0.65, 0.7, 1.0, rng.random()])
+            CONFIG["diversity"]["max_per_category"] = rng.choice([1, 2, 3, 5])
+
+            expected = [c["_id"] for c in reference_diversify(candidates, max_results, lambda_param)]
+            actual = [c["_id"] for c in diversify_recommendations(candidates, max_results, lambda_param)]
+            if expected != actual:
+                mismatches.append((trial, expected, actual))
+    finally:
+        CONFIG["diversity"]["max_per_category"] = saved_cap
+
+    print(f"  {TRIALS} random inputs (seed {SEED}), {len(mismatches)} mismatches")
+    for trial, expected, actual in mismatches[:5]:
+        print(f"  [FAIL] trial {trial}: expected {expected}, got {actual}")
+    if not mismatches:
+        print("  [PASS] heap version matches the reference")
+    return not mismatches
+
+
+def test_timing():
+    print_section("2. TIMING (600 candidates, 16 categories, top 50)")
+    rng = random.Random(SEED)
+    candidates = sorted(
+        (
+            {"_id": i, "category": rng.choice(list("ABCDEFGHIJKLMNOP")), "recommendation_score": rng.random()}
+            for i in range(600)
+        ),
+        key=lambda c: -c["recommendation_score"],
+    )
+    for name, fn in (("reference", reference_diversify), ("heap", diversify_recommendations)):
+        start = time.perf_counter()
+        fn(candidates, 50, 0.7)
+        print(f"  {name:10s} {(time.perf_counter() - start) * 1000:8.2f}ms")
+
+
+if __name__ == "__main__":
+    passed = test_equivalence()
+    test_timing()
+    sys.exit(0 if passed else 1)